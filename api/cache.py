@@ -0,0 +1,82 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ResponseCache:
+    """Two-tier cache for model completions.
+
+    The memory tier is an LRU bounded by entry count; the optional shared tier
+    is a state backend (see ``api.state``) that survives restarts and is seen
+    by every worker process. Both tiers expire entries after ``ttl_seconds``.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 86400, store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+
+    @staticmethod
+    def make_key(model: str, system, prompt, temperature: float, max_tokens: int, version: str = None) -> str:
+        """Hash the inputs that determine a completion into a stable cache key.
+
+        ``version`` names the prompt template set, so entries written by other
+        templates are never served.
+        """
+        inputs = [model, system or "", prompt, temperature, max_tokens]
+        if version is not None:
+            inputs.append(version)
+        payload = json.dumps(
+            inputs,
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+        if self.store is not None:
+            value = await self.store.cache_get(key, self.ttl_seconds)
+            if value is not None:
+                self._remember(key, value, now)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self._remember(key, value, time.time())
+        if self.store is not None:
+            await self.store.cache_set(key, value, self.ttl_seconds)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def _remember(self, key: str, value: str, now: float):
+        self._memory[key] = (now + self.ttl_seconds, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
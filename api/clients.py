@@ -0,0 +1,133 @@
+"""The one place the Anthropic client is created.
+
+Nothing here runs at import time: the SDK is imported and the client built
+on first use (or by ``warm_up()`` at startup), so the app starts and answers
+liveness probes even before the client exists or when the API key is missing.
+A failed warm-up is retried by the readiness probe; a missing key is not.
+"""
+import asyncio
+import logging
+import time
+
+from .config import (
+    ANTHROPIC_API_KEY,
+    ANTHROPIC_BASE_URL,
+    ANTHROPIC_MAX_CONNECTIONS,
+    ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+    ANTHROPIC_CONNECT_TIMEOUT,
+    ANTHROPIC_SCRIPT_TIMEOUT,
+    ANTHROPIC_WARM_CONNECTIONS,
+    MODEL_CALL_MODE,
+    MODEL_CALL_ARCHIVE,
+    MODEL_REPLAY_TIMING,
+    MODEL_REPLAY_STRICT,
+)
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_http_client = None
+_warm = False
+_last_error = None
+# Set when the settings cannot produce a client; warming up again would not help
+_misconfigured = False
+_warm_up_task = None
+
+
+class ConfigurationError(RuntimeError):
+    """The model client cannot be created with the current settings."""
+
+
+def get_client():
+    """Return the shared AsyncAnthropic client, creating it on first use."""
+    global _client, _http_client, _last_error, _misconfigured
+    if _client is not None:
+        return _client
+    if MODEL_CALL_MODE == "replay":
+        from .replay import ModelCallArchive, ReplayClient
+
+        # Offline: no key, no network, calls are served from the archive
+        _client = ReplayClient(ModelCallArchive(MODEL_CALL_ARCHIVE), timing=MODEL_REPLAY_TIMING, strict=MODEL_REPLAY_STRICT)
+        return _client
+    if not ANTHROPIC_API_KEY:
+        _last_error = "ANTHROPIC_API_KEY environment variable is not set"
+        _misconfigured = True
+        raise ConfigurationError(_last_error)
+    import anthropic
+    import httpx
+
+    # One pooled async transport shared by every model call so concurrent
+    # requests overlap their network waits instead of blocking the event loop.
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(ANTHROPIC_SCRIPT_TIMEOUT, connect=ANTHROPIC_CONNECT_TIMEOUT)
+    )
+    # Retries are handled by ModelDispatcher so they respect the global limits
+    _client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL, http_client=_http_client, max_retries=0)
+    if MODEL_CALL_MODE == "record":
+        from .replay import ModelCallArchive, RecordingClient
+
+        _client = RecordingClient(_client, ModelCallArchive(MODEL_CALL_ARCHIVE))
+        logger.info(f"Recording model calls to {MODEL_CALL_ARCHIVE}")
+    logger.info("Initialized Anthropic client")
+    return _client
+
+
+async def warm_up():
+    """Create the client and open keep-alive connections so the first model call skips the TLS handshake."""
+    global _warm, _last_error
+    started = time.perf_counter()
+    try:
+        client = get_client()
+        if client.base_url is None:
+            # Replaying; there is no connection pool to prime
+            _warm = True
+            return True
+        # Any response will do; the point is an established connection left in the pool
+        results = await asyncio.gather(
+            *(_http_client.get(str(client.base_url), timeout=ANTHROPIC_CONNECT_TIMEOUT) for _ in range(ANTHROPIC_WARM_CONNECTIONS)),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+    except Exception as e:
+        _last_error = f"Client warm-up failed: {e}"
+        logger.error(_last_error)
+        return False
+    _warm = True
+    _last_error = None
+    logger.info(f"Anthropic client ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return True
+
+
+def start_warm_up():
+    """Warm up in a background task, unless one is running, the client is warm or cannot be configured.
+
+    Called at startup and again by the readiness probe while the client is not
+    warm, so a warm-up that failed on a transient network error is retried.
+    """
+    global _warm_up_task
+    if _warm or _misconfigured or (_warm_up_task is not None and not _warm_up_task.done()):
+        return
+    _warm_up_task = asyncio.create_task(warm_up())
+
+
+def readiness() -> dict:
+    """Whether the client is built and its connection pool primed, with the reason if not."""
+    return {"ready": _warm, "client": _client is not None, "error": _last_error}
+
+
+async def close():
+    global _client, _http_client, _warm, _warm_up_task
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+        _warm_up_task = None
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _http_client = None
+    _warm = False
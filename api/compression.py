@@ -0,0 +1,185 @@
+import asyncio
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    # Listed in requirements.txt; without it only gzip is offered
+    brotli = None
+
+# Streams are flushed event by event; compressing them would buffer events or need a flush per event
+STREAMING_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+# Bodies at least this large are compressed in a worker thread to keep the event loop responsive
+THREAD_COMPRESSION_SIZE = 64 * 1024
+
+# Request body encodings: zlib window bits for gzip and zlib-wrapped deflate
+REQUEST_ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "x-gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Pick "br", "gzip" or None (identity) from an Accept-Encoding header, honouring q-values."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda encoding: accepted.get(encoding, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """Compress a chunk; unfinished output is flushed so each chunk reaches the client when sent."""
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.finish() if finish else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware for compressed responses and request bodies.
+
+    Responses of at least ``minimum_size`` bytes are compressed with brotli or
+    gzip, as negotiated through Accept-Encoding; NDJSON and SSE streams are
+    passed through untouched. Request bodies sent with Content-Encoding gzip
+    or deflate are decompressed (up to ``max_request_size`` bytes) before the
+    endpoint reads them.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 5, max_request_size: int = 10 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_request_size = max_request_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding != "identity":
+            try:
+                if content_encoding not in REQUEST_ENCODINGS:
+                    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+                body = await self._decompress_body(receive, REQUEST_ENCODINGS[content_encoding])
+            except HTTPException as e:
+                await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")
+            ] + [(b"content-length", str(len(body)).encode("latin-1"))]
+            receive = self._replay(body, receive)
+
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, self._compressing_send(send, encoding))
+
+    async def _decompress_body(self, receive, wbits: int) -> bytes:
+        decompressor = zlib.decompressobj(wbits)
+        chunks = []
+        size = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                more_body = message.get("more_body", False)
+                data = message.get("body", b"")
+                # Bounded output per call so a small "zip bomb" cannot exhaust memory
+                while data:
+                    chunk = decompressor.decompress(data, self.max_request_size - size + 1)
+                    size += len(chunk)
+                    if size > self.max_request_size:
+                        raise HTTPException(status_code=413, detail=f"Decompressed request body too large (limit {self.max_request_size} bytes)")
+                    chunks.append(chunk)
+                    data = decompressor.unconsumed_tail
+            chunks.append(decompressor.flush())
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid compressed request body: {e}")
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay
+
+    def _compressing_send(self, send, encoding: str):
+        start = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                response_headers = Headers(raw=message.get("headers", []))
+                media_type = response_headers.get("content-type", "").split(";")[0].strip()
+                if media_type in STREAMING_MEDIA_TYPES or "content-encoding" in response_headers:
+                    await send(message)
+                else:
+                    # Held back until the first body chunk decides whether to compress
+                    start = message
+                return
+            if message["type"] != "http.response.body" or (start is None and compressor is None):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                response_headers = MutableHeaders(raw=list(start.get("headers", [])))
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                if len(body) >= THREAD_COMPRESSION_SIZE:
+                    body = await asyncio.to_thread(compressor.compress, body, not more_body)
+                else:
+                    body = compressor.compress(body, finish=not more_body)
+                if more_body:
+                    del response_headers["content-length"]
+                else:
+                    response_headers["Content-Length"] = str(len(body))
+                await send({**start, "headers": response_headers.raw})
+                start = None
+            else:
+                body = compressor.compress(body, finish=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        return compressing_send
@@ -5,19 +5,144 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # API Settings
-API_HOST = "0.0.0.0"
-API_PORT = 8000
-DEBUG = True
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+
+# Server processes (python -m api.server, or gunicorn -c api/gunicorn_conf.py)
+API_WORKERS = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+API_KEEPALIVE_SECONDS = int(os.getenv("API_KEEPALIVE_SECONDS", "5"))
+# Gunicorn restarts a worker whose event loop has not checked in for this long
+API_WORKER_TIMEOUT = int(os.getenv("API_WORKER_TIMEOUT", "120"))
+# On SIGTERM, in-flight requests and then running jobs each get this long to finish
+SHUTDOWN_DRAIN_SECONDS = int(os.getenv("SHUTDOWN_DRAIN_SECONDS", "60"))
+
+# Shared state for rate limits and the response cache
+# "memory" keeps it per process; "sqlite" shares it between all workers on the host
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")
+SHARED_STATE_DB_PATH = os.getenv("SHARED_STATE_DB_PATH", "shared_state.db")
 
 # CORS Settings
 CORS_ORIGINS = [
     "https://word-generator-frontend.vercel.app"
 ]
 
+# Compression: responses of at least COMPRESSION_MINIMUM_SIZE bytes are sent with brotli or
+# gzip as the client accepts; gzip/deflate request bodies are decompressed up to the size limit
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+REQUEST_MAX_DECOMPRESSED_BYTES = int(os.getenv("REQUEST_MAX_DECOMPRESSED_BYTES", str(10 * 1024 * 1024)))
+
 # Anthropic API Settings
+# Read here but only checked when the client is first created (api/clients.py), so a
+# missing key fails readiness and model calls instead of the whole process
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not ANTHROPIC_API_KEY:
-    raise ValueError(
-        "ANTHROPIC_API_KEY environment variable is not set. "
-        "Please set it in your .env file or environment variables."
-    ) 
\ No newline at end of file
+
+# Anthropic HTTP client settings
+# Point the client at another Messages API endpoint, e.g. the local mock in bench/
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+# All model calls share one pooled async HTTP transport sized by these values.
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "20"))
+ANTHROPIC_CONNECT_TIMEOUT = float(os.getenv("ANTHROPIC_CONNECT_TIMEOUT", "10"))
+# Keep-alive connections opened at startup so the first requests skip the TLS handshake
+ANTHROPIC_WARM_CONNECTIONS = int(os.getenv("ANTHROPIC_WARM_CONNECTIONS", "2"))
+# Per-request read timeouts (seconds) for long script parts and short segment calls
+ANTHROPIC_SCRIPT_TIMEOUT = float(os.getenv("ANTHROPIC_SCRIPT_TIMEOUT", "300"))
+ANTHROPIC_SEGMENT_TIMEOUT = float(os.getenv("ANTHROPIC_SEGMENT_TIMEOUT", "120"))
+
+
+# Outline-first generation
+# Maximum number of script parts generated concurrently for one request
+PARALLEL_PART_CONCURRENCY = int(os.getenv("PARALLEL_PART_CONCURRENCY", "4"))
+
+# Forbidden words: generated paragraphs are scanned and offending ones rewritten by small repair calls
+FORBIDDEN_WORDS_ENFORCED = os.getenv("FORBIDDEN_WORDS_ENFORCED", "true").lower() == "true"
+FORBIDDEN_REPAIR_MAX_ATTEMPTS = int(os.getenv("FORBIDDEN_REPAIR_MAX_ATTEMPTS", "2"))
+
+# Response cache
+# In-memory LRU tier, plus a SQLite tier when RESPONSE_CACHE_DB_PATH is set or the
+# shared state backend is "sqlite"
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_DB_PATH = os.getenv("RESPONSE_CACHE_DB_PATH", "")
+RESPONSE_CACHE_MAX_DISK_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_DISK_ENTRIES", "10000"))
+
+# Prompt prefix caching
+# The system prompt, transcript and structure are sent as a stable prefix marked
+# with cache_control so repeated calls for the same script reuse it.
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_BETA_HEADER = os.getenv("PROMPT_CACHE_BETA_HEADER", "prompt-caching-2024-07-31")
+
+# Background jobs
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job is leased to one server process; an expired lease means the process died
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+# Script sessions: server-side scripts edited by session id and paragraph index
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+# Sessions untouched for this long are deleted
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(7 * 86400)))
+
+# Continuation budget
+# Upper bounds on the continuation rounds that top up a script short of its target
+CONTINUATION_MAX_ROUNDS = int(os.getenv("CONTINUATION_MAX_ROUNDS", "4"))
+CONTINUATION_TOKEN_BUDGET = int(os.getenv("CONTINUATION_TOKEN_BUDGET", "12000"))
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "900"))
+
+# Model call dispatching
+# Global cap on concurrent upstream calls and per-minute pacing (0 disables a limit)
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))
+MODEL_REQUESTS_PER_MINUTE = float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "50"))
+MODEL_TOKENS_PER_MINUTE = float(os.getenv("MODEL_TOKENS_PER_MINUTE", "0"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "1.0"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "30"))
+
+# Prompt templates and CTA schedule
+# JSON file overriding the built-in templates and CTAs (format in api/templates.py)
+PROMPT_TEMPLATES_PATH = os.getenv("PROMPT_TEMPLATES_PATH") or None
+# Channel section of that file used by this deployment
+PROMPT_CHANNEL = os.getenv("PROMPT_CHANNEL") or None
+
+# Recording and replay of model calls, for offline regression and performance runs
+# "live" calls the API, "record" also appends every call to MODEL_CALL_ARCHIVE and
+# "replay" serves calls from the archive without an API key or network
+MODEL_CALL_MODE = os.getenv("MODEL_CALL_MODE", "live")
+MODEL_CALL_ARCHIVE = os.getenv("MODEL_CALL_ARCHIVE", "model_calls.jsonl.gz")
+# "recorded" keeps the original latency and chunk timing; "fast" serves calls immediately
+MODEL_REPLAY_TIMING = os.getenv("MODEL_REPLAY_TIMING", "recorded")
+# Otherwise a request that was never recorded (e.g. after a prompt change) gets the
+# recorded calls with the same max_tokens, in order
+MODEL_REPLAY_STRICT = os.getenv("MODEL_REPLAY_STRICT", "true").lower() == "true"
+
+# Model routing
+# The premium model writes openings and everything not routed elsewhere
+MODEL_DEFAULT = os.getenv("MODEL_DEFAULT", "claude-3-5-sonnet-20240620")
+MODEL_FAST = os.getenv("MODEL_FAST", "claude-3-5-haiku-20241022")
+# Comma-separated "task[<=words]:model" rules, first match wins; "default" and "fast" name
+# the models above. Tasks: opening, part, outline, continuation, transition, regenerate, repair
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "repair:fast,transition:fast,regenerate<=600:fast,continuation<=800:fast")
+# Comma-separated "model:fallback" pairs; an overloaded (429/529) model is retried on its fallback
+MODEL_FALLBACKS = os.getenv("MODEL_FALLBACKS", "fast:default")
+
+# Hedged requests: a short call without a first token after the given percentile of
+# recent first-token latencies gets a second identical call, and the first to finish wins
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Used until enough first-token latencies have been observed
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "3"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# Hedges allowed per eligible call, i.e. the cap on extra upstream calls
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+# Only calls asking for at most this many words are hedged
+HEDGE_MAX_WORDS = int(os.getenv("HEDGE_MAX_WORDS", "600"))
+
+# Batch segment regeneration
+BATCH_REGENERATE_CONCURRENCY = int(os.getenv("BATCH_REGENERATE_CONCURRENCY", "4"))
+
+# Observability: fraction of requests written to the structured request log (errors are always logged)
+METRICS_LOG_SAMPLE_RATE = float(os.getenv("METRICS_LOG_SAMPLE_RATE", "1.0"))
\ No newline at end of file
@@ -0,0 +1,111 @@
+import math
+import time
+from typing import Optional
+
+# Fallback yield before any part has been observed (English prose is ~0.75 words/token)
+DEFAULT_WORDS_PER_TOKEN = 0.75
+# Headroom on max_tokens so a part is not cut off mid-paragraph
+MAX_TOKENS_HEADROOM = 1.15
+MIN_MAX_TOKENS = 256
+
+
+class ContinuationPlanner:
+    """Decides whether and how large the next continuation round should be.
+
+    Keeps a running word count instead of recounting the whole story, learns the
+    words-per-token yield from finished calls and stops once the target is met
+    or the round, output-token or deadline budget is exhausted.
+    """
+
+    def __init__(self, target_words: int, max_words_per_round: int, max_rounds: int, token_budget: int, deadline_seconds: float, max_tokens_per_round: int = 4000, started_at: float = None):
+        self.target_words = target_words
+        self.max_words_per_round = max_words_per_round
+        self.max_rounds = max_rounds
+        self.token_budget = token_budget
+        self.max_tokens_per_round = max_tokens_per_round
+        self.deadline = (started_at if started_at is not None else time.monotonic()) + deadline_seconds
+        self.total_words = 0
+        self.rounds = 0
+        self.tokens_used = 0
+        self.stop_reason = None
+        self._observed_words = 0
+        self._observed_tokens = 0
+        self._last_round_words = None
+
+    @property
+    def remaining_words(self) -> int:
+        return max(0, self.target_words - self.total_words)
+
+    @property
+    def words_per_token(self) -> float:
+        if self._observed_tokens:
+            return self._observed_words / self._observed_tokens
+        return DEFAULT_WORDS_PER_TOKEN
+
+    @property
+    def partial(self) -> bool:
+        return self.stop_reason not in (None, "completed")
+
+    def observe(self, words: int, output_tokens: int):
+        """Record the words and output tokens produced by the initial parts."""
+        self.total_words += words
+        if output_tokens > 0:
+            self._observed_words += words
+            self._observed_tokens += output_tokens
+
+    def add_existing(self, words: int):
+        """Count words written by an earlier run; their tokens are unknown, so they do not affect the yield."""
+        self.total_words += words
+
+    def observe_round(self, words: int, output_tokens: int):
+        """Record the result of a continuation round."""
+        self.rounds += 1
+        self.tokens_used += output_tokens
+        self._last_round_words = words
+        self.observe(words, output_tokens)
+
+    def expired(self) -> bool:
+        """Whether the generation deadline has passed; checked before each planned part as well as each round."""
+        return time.monotonic() >= self.deadline
+
+    def state(self) -> dict:
+        """Budgets used and yield learned so far, to resume an interrupted run within the same budgets."""
+        # The deadline is kept as wall-clock time; the monotonic clock does not survive a restart
+        return {
+            "rounds": self.rounds,
+            "tokens_used": self.tokens_used,
+            "deadline_at": time.time() + self.deadline - time.monotonic(),
+            "observed_words": self._observed_words,
+            "observed_tokens": self._observed_tokens,
+        }
+
+    def restore(self, state: dict):
+        """Continue from a ``state()`` snapshot taken by an earlier run."""
+        self.rounds = state.get("rounds", 0)
+        self.tokens_used = state.get("tokens_used", 0)
+        self._observed_words = state.get("observed_words", 0)
+        self._observed_tokens = state.get("observed_tokens", 0)
+        if state.get("deadline_at") is not None:
+            self.deadline = time.monotonic() + state["deadline_at"] - time.time()
+
+    def next_round(self) -> Optional[dict]:
+        """Return the word target and max_tokens for the next round, or None to stop."""
+        if self.remaining_words <= 0:
+            self.stop_reason = "completed"
+        elif self.rounds >= self.max_rounds:
+            self.stop_reason = "max_rounds"
+        elif self.token_budget - self.tokens_used < MIN_MAX_TOKENS:
+            self.stop_reason = "token_budget"
+        elif self.expired():
+            self.stop_reason = "deadline"
+        elif self._last_round_words == 0:
+            self.stop_reason = "stalled"
+        if self.stop_reason:
+            return None
+
+        tokens_left = min(self.token_budget - self.tokens_used, self.max_tokens_per_round)
+        word_count = min(self.remaining_words, self.max_words_per_round, math.floor(tokens_left * self.words_per_token / MAX_TOKENS_HEADROOM))
+        word_count = max(word_count, 1)
+        max_tokens = math.ceil(word_count / self.words_per_token * MAX_TOKENS_HEADROOM)
+        max_tokens = min(max(max_tokens, MIN_MAX_TOKENS), tokens_left)
+        return {"word_count": word_count, "max_tokens": max_tokens}
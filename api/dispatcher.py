@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from .clients import ConfigurationError
+from .metrics import MODEL_RETRIES, MODEL_COALESCED, MODEL_FALLBACKS, MODEL_HEDGE_ELIGIBLE, MODEL_HEDGES, MODEL_HEDGES_DENIED
+from .state import MemoryStateBackend
+
+logger = logging.getLogger(__name__)
+
+
+def _retryable_errors() -> tuple:
+    """Errors worth retrying: 429s, 5xx/529 overloaded responses, timeouts and dropped connections.
+
+    The SDK is imported here rather than at module level so importing the app
+    stays cheap; by the time an error is raised it is already loaded.
+    """
+    import anthropic
+
+    return (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute; waiters in this process are served in order.
+
+    The bucket level lives in a state backend, so workers sharing a backend
+    share one budget.
+    """
+
+    def __init__(self, per_minute: float, name: str = "default", state=None):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.name = name
+        self.state = state or MemoryStateBackend()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while (wait := await self.state.take_tokens(self.name, amount, self.capacity, self.rate)) > 0:
+                await asyncio.sleep(wait)
+
+    async def refund(self, amount: float):
+        """Return reserved units that a finished call did not use."""
+        if amount > 0:
+            await self.state.refund_tokens(self.name, amount, self.capacity, self.rate)
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Rough upper bound on the tokens a request will consume (~4 characters per token)."""
+    chars = 0
+    system = kwargs.get("system") or ""
+    if isinstance(system, str):
+        chars += len(system)
+    else:
+        chars += sum(len(block.get("text", "")) for block in system)
+    for message in kwargs["messages"]:
+        content = message["content"]
+        chars += len(content) if isinstance(content, str) else sum(len(block.get("text", "")) for block in content)
+    return chars // 4 + kwargs["max_tokens"]
+
+
+def _retry_after(error: Exception):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _is_overloaded(error: Exception) -> bool:
+    """Rate limited (429) or overloaded (529): worth moving to another model rather than waiting."""
+    return getattr(error, "status_code", None) in (429, 529)
+
+
+def _to_http_exception(error: Exception) -> HTTPException:
+    """Map an upstream failure that survived all retries to a meaningful status code."""
+    import anthropic
+
+    retry_after = _retry_after(error)
+    headers = {"Retry-After": str(int(retry_after) + 1)} if retry_after else None
+    if isinstance(error, anthropic.RateLimitError):
+        return HTTPException(status_code=429, detail="Model provider rate limit reached, please retry later", headers=headers)
+    if isinstance(error, anthropic.APITimeoutError):
+        return HTTPException(status_code=504, detail="Model provider timed out")
+    if isinstance(error, anthropic.APIConnectionError):
+        return HTTPException(status_code=502, detail="Could not reach model provider")
+    return HTTPException(status_code=503, detail="Model provider is overloaded, please retry later", headers=headers)
+
+
+class ModelDispatcher:
+    """Single gateway for model calls.
+
+    Bounds concurrent upstream calls with a semaphore, paces them with
+    request-per-minute and token-per-minute buckets, retries transient
+    failures with jittered exponential backoff (honouring retry-after),
+    coalesces identical in-flight requests into one upstream call and, with a
+    ``HedgePolicy``, hedges slow calls with a second identical one. A call
+    whose model is overloaded moves once to the model returned by
+    ``fallback(model)``, without waiting.
+    """
+
+    def __init__(self, get_client, max_concurrency: int = 16, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0, state=None, hedge=None, fallback=None):
+        self._get_client = get_client
+        self.hedge = hedge
+        self.fallback = fallback
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # The concurrency cap is per process; the per-minute budgets are shared through ``state``
+        self._request_bucket = TokenBucket(requests_per_minute, "model_requests", state) if requests_per_minute > 0 else None
+        self._token_bucket = TokenBucket(tokens_per_minute, "model_tokens", state) if tokens_per_minute > 0 else None
+        self._inflight = {}
+        self.retries = 0
+        self.coalesced = 0
+
+    @property
+    def client(self):
+        """The model client, created on first use; a missing API key surfaces as a 503."""
+        try:
+            return self._get_client()
+        except ConfigurationError as e:
+            raise HTTPException(status_code=503, detail=f"Model provider is not configured: {e}")
+
+    async def create(self, kwargs: dict, coalesce_key: str = None, hedge_task: str = None):
+        """Create a message, returning ``(response, shared)``.
+
+        ``shared`` is True when the response came from an identical request that
+        was already in flight, so callers do not count its usage twice. Calls
+        with a ``hedge_task`` are hedged (when a hedge policy is configured)
+        using the first-token latencies seen for that task.
+        """
+        if coalesce_key is None:
+            return await self._create_with_retries(kwargs, hedge_task), False
+        task = self._inflight.get(coalesce_key)
+        if task is not None:
+            self.coalesced += 1
+            MODEL_COALESCED.inc()
+            return await asyncio.shield(task), True
+        task = asyncio.ensure_future(self._create_with_retries(kwargs, hedge_task))
+        self._inflight[coalesce_key] = task
+        try:
+            return await asyncio.shield(task), False
+        finally:
+            if self._inflight.get(coalesce_key) is task:
+                del self._inflight[coalesce_key]
+
+    @asynccontextmanager
+    async def stream(self, kwargs: dict):
+        """Open a message stream; only failures before the first event are retried."""
+        attempt = 0
+        fell_back = False
+        while True:
+            await self._semaphore.acquire()
+            try:
+                reserved = await self._reserve(kwargs)
+                manager = self.client.messages.stream(**kwargs)
+                stream = await manager.__aenter__()
+                break
+            except _retryable_errors() as e:
+                self._semaphore.release()
+                fallback = self._fall_back(kwargs, e) if not fell_back else None
+                if fallback is not None:
+                    kwargs, fell_back = fallback, True
+                    continue
+                if attempt >= self.max_retries:
+                    raise _to_http_exception(e)
+                await self._backoff(attempt, e)
+                attempt += 1
+            except BaseException:
+                self._semaphore.release()
+                raise
+        try:
+            yield stream
+        except BaseException:
+            if not await manager.__aexit__(*sys.exc_info()):
+                raise
+        else:
+            await manager.__aexit__(None, None, None)
+            await self._settle(reserved, stream)
+        finally:
+            self._semaphore.release()
+
+    async def _create_with_retries(self, kwargs: dict, hedge_task: str = None):
+        attempt = 0
+        fell_back = False
+        while True:
+            try:
+                if hedge_task is not None and self.hedge is not None:
+                    return await self._create_hedged(kwargs, hedge_task)
+                return await self._create_once(kwargs)
+            except _retryable_errors() as e:
+                error = e
+            fallback = self._fall_back(kwargs, error) if not fell_back else None
+            if fallback is not None:
+                kwargs, fell_back = fallback, True
+                continue
+            if attempt >= self.max_retries:
+                raise _to_http_exception(error)
+            await self._backoff(attempt, error)
+            attempt += 1
+
+    async def _create_once(self, kwargs: dict):
+        async with self._semaphore:
+            reserved = await self._reserve(kwargs)
+            response = await self.client.messages.create(**kwargs)
+        if self._token_bucket is not None:
+            await self._token_bucket.refund(reserved - response.usage.input_tokens - response.usage.output_tokens)
+        return response
+
+    async def _stream_once(self, kwargs: dict, on_first_token):
+        """Like _create_once, but streamed so the arrival of the first token can be observed."""
+        async with self._semaphore:
+            reserved = await self._reserve(kwargs)
+            async with self.client.messages.stream(**kwargs) as stream:
+                async for _ in stream.text_stream:
+                    if on_first_token is not None:
+                        on_first_token()
+                        on_first_token = None
+                response = await stream.get_final_message()
+        if self._token_bucket is not None:
+            await self._token_bucket.refund(reserved - response.usage.input_tokens - response.usage.output_tokens)
+        return response
+
+    async def _create_hedged(self, kwargs: dict, task: str):
+        """Race a second identical call against one that is slow to start; the loser is cancelled."""
+        self.hedge.admit()
+        MODEL_HEDGE_ELIGIBLE.labels(task).inc()
+        started = time.perf_counter()
+        first_token = asyncio.Event()
+
+        def primary_first_token():
+            first_token.set()
+            self.hedge.observe_first_token(task, time.perf_counter() - started)
+
+        primary = asyncio.ensure_future(self._stream_once(kwargs, primary_first_token))
+        waiter = asyncio.ensure_future(first_token.wait())
+        calls = [primary]
+        try:
+            await asyncio.wait({primary, waiter}, timeout=self.hedge.delay(task), return_when=asyncio.FIRST_COMPLETED)
+            if primary.done() or first_token.is_set():
+                return await primary
+            if not self.hedge.try_spend():
+                MODEL_HEDGES_DENIED.labels(task).inc()
+                return await primary
+            logger.info(f"Hedging {task} call after {time.perf_counter() - started:.1f}s without a first token")
+            calls.append(asyncio.ensure_future(self._stream_once(kwargs, None)))
+            pending = set(calls)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for call in done:
+                    if call.exception() is None:
+                        MODEL_HEDGES.labels(task, "primary" if call is primary else "hedge").inc()
+                        if call is not primary and not first_token.is_set():
+                            # Censored sample: the primary was at least this slow
+                            self.hedge.observe_first_token(task, time.perf_counter() - started)
+                        return call.result()
+            MODEL_HEDGES.labels(task, "failed").inc()
+            return primary.result()
+        finally:
+            waiter.cancel()
+            for call in calls:
+                call.cancel()
+            await asyncio.gather(waiter, *calls, return_exceptions=True)
+
+    async def _reserve(self, kwargs: dict) -> int:
+        reserved = estimate_tokens(kwargs)
+        if self._request_bucket is not None:
+            await self._request_bucket.acquire(1)
+        if self._token_bucket is not None:
+            await self._token_bucket.acquire(reserved)
+        return reserved
+
+    async def _settle(self, reserved: int, stream):
+        if self._token_bucket is None:
+            return
+        message = getattr(stream, "current_message_snapshot", None)
+        if message is not None:
+            await self._token_bucket.refund(reserved - message.usage.input_tokens - message.usage.output_tokens)
+
+    def _fall_back(self, kwargs: dict, error: Exception):
+        """The request moved to the fallback of its model, or None if the error or model has none."""
+        if self.fallback is None or not _is_overloaded(error):
+            return None
+        fallback = self.fallback(kwargs["model"])
+        if fallback is None:
+            return None
+        MODEL_FALLBACKS.labels(kwargs["model"], fallback).inc()
+        logger.warning(f"Model {kwargs['model']} is overloaded ({type(error).__name__}), falling back to {fallback}")
+        return {**kwargs, "model": fallback}
+
+    async def _backoff(self, attempt: int, error: Exception):
+        self.retries += 1
+        MODEL_RETRIES.labels(type(error).__name__).inc()
+        # Full jitter, but never earlier than the provider asked us to wait
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        logger.warning(f"Model call failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,114 @@
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Marks the end of a word in the trie
+_END = ""
+
+
+def normalize_forbidden_words(forbidden_words) -> frozenset:
+    """Lower-cased, whitespace-collapsed entries; a plain string is read as a comma-separated list."""
+    if not forbidden_words:
+        return frozenset()
+    if isinstance(forbidden_words, str):
+        forbidden_words = forbidden_words.split(",")
+    return frozenset(" ".join(str(word).split()).lower() for word in forbidden_words if str(word).strip())
+
+
+def _trie_pattern(node: dict) -> str:
+    optional = _END in node
+    singles = []
+    alternatives = []
+    for char in sorted(key for key in node if key != _END):
+        child = node[char]
+        if list(child) == [_END] and char != " ":
+            singles.append(re.escape(char))
+        else:
+            alternatives.append((r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child))
+    if singles:
+        alternatives.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+    if not alternatives:
+        return ""
+    pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if optional:
+        pattern = f"(?:{pattern})?"
+    return pattern
+
+
+class ForbiddenWordMatcher:
+    """Finds forbidden words and phrases in text with one precompiled regex.
+
+    The words are merged into a trie so the regex shares common prefixes
+    instead of trying thousands of alternatives at every position. Matches are
+    case-insensitive, whole-word only (``ban`` does not match ``banana``) and
+    phrases match across any run of whitespace.
+    """
+
+    def __init__(self, words: frozenset):
+        self.words = words
+        self._regex = None
+        if words:
+            trie = {}
+            for word in words:
+                node = trie
+                for char in word:
+                    node = node.setdefault(char, {})
+                node[_END] = {}
+            self._regex = re.compile(r"(?<!\w)" + _trie_pattern(trie) + r"(?!\w)", re.IGNORECASE)
+
+    def __bool__(self):
+        return self._regex is not None
+
+    def find(self, text: str) -> list[str]:
+        """Distinct forbidden entries present in ``text``, in order of first appearance."""
+        if self._regex is None or not text:
+            return []
+        found = {}
+        for match in self._regex.finditer(text):
+            found.setdefault(" ".join(match.group().split()).lower(), None)
+        return list(found)
+
+
+# Compiled matchers by word set, most recently used last
+_MAX_CACHED_MATCHERS = 256
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def _cached(words: frozenset) -> Optional[ForbiddenWordMatcher]:
+    with _matchers_lock:
+        matcher = _matchers.get(words)
+        if matcher is not None:
+            _matchers.move_to_end(words)
+        return matcher
+
+
+def _compile(words: frozenset) -> ForbiddenWordMatcher:
+    matcher = ForbiddenWordMatcher(words)
+    with _matchers_lock:
+        _matchers[words] = matcher
+        while len(_matchers) > _MAX_CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def compile_forbidden_words(forbidden_words) -> ForbiddenWordMatcher:
+    """Return the matcher for a forbidden-word list, compiling each distinct list only once."""
+    words = normalize_forbidden_words(forbidden_words)
+    matcher = _cached(words)
+    return matcher if matcher is not None else _compile(words)
+
+
+async def compile_forbidden_words_async(forbidden_words) -> ForbiddenWordMatcher:
+    """Like compile_forbidden_words, but a list that is not cached yet is compiled in a worker thread.
+
+    Building the regex for a list of thousands of words takes a few hundred
+    milliseconds, which would otherwise stall every request on the event loop.
+    """
+    words = normalize_forbidden_words(forbidden_words)
+    if not words:
+        return ForbiddenWordMatcher(words)
+    matcher = _cached(words)
+    return matcher if matcher is not None else await asyncio.to_thread(_compile, words)
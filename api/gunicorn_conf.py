@@ -0,0 +1,52 @@
+"""Gunicorn settings for running the API with uvicorn workers.
+
+    gunicorn -c api/gunicorn_conf.py api.main:app
+"""
+import os
+import sys
+
+# Gunicorn loads this file by path; make the api package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.config import (  # noqa: E402
+    API_HOST,
+    API_PORT,
+    API_WORKERS,
+    API_KEEPALIVE_SECONDS,
+    API_WORKER_TIMEOUT,
+    DEBUG,
+    SHUTDOWN_DRAIN_SECONDS,
+)
+from api.server import prepare_workers  # noqa: E402
+from uvicorn.workers import UvicornWorker  # noqa: E402
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    """UvicornWorker that gives in-flight requests SHUTDOWN_DRAIN_SECONDS, like python -m api.server.
+
+    The stock worker sets no graceful shutdown timeout, so open requests and
+    streams could use all of graceful_timeout and leave nothing for draining jobs.
+    """
+
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "timeout_graceful_shutdown": SHUTDOWN_DRAIN_SECONDS}
+
+
+bind = f"{API_HOST}:{API_PORT}"
+workers = API_WORKERS
+worker_class = DrainingUvicornWorker
+keepalive = API_KEEPALIVE_SECONDS
+timeout = API_WORKER_TIMEOUT
+# In-flight requests, then running jobs, each get SHUTDOWN_DRAIN_SECONDS; the margin
+# leaves time to release unfinished jobs before the worker is killed
+graceful_timeout = SHUTDOWN_DRAIN_SECONDS * 2 + 10
+loglevel = "debug" if DEBUG else "info"
+forwarded_allow_ips = "*"
+
+# Must run before prometheus_client is imported anywhere in the master
+prepare_workers(workers)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
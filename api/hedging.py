@@ -0,0 +1,46 @@
+import math
+from collections import deque
+
+
+class HedgePolicy:
+    """Decides when a slow model call gets a second, identical "hedge" call.
+
+    The hedge delay is a percentile of recently observed time-to-first-token
+    for the same task, so only the slowest few percent of calls are hedged.
+    Hedges are paid from a budget that grows by ``budget_ratio`` per eligible
+    call (capped at ``burst``), which bounds the extra upstream cost.
+    """
+
+    def __init__(self, percentile: float = 95, default_delay: float = 3.0, min_delay: float = 0.5, budget_ratio: float = 0.05, burst: float = 5, window: int = 200, min_samples: int = 20):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._budget = burst
+
+    def observe_first_token(self, task: str, seconds: float):
+        self._samples.setdefault(task, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, task: str) -> float:
+        """Seconds to wait for the first token before hedging a call of this task."""
+        samples = self._samples.get(task)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def admit(self):
+        """Account for one eligible call, adding to the hedge budget."""
+        self._budget = min(self.burst, self._budget + self.budget_ratio)
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget, if any is left."""
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
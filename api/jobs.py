@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from .usage import track_usage
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states are picked up again when the worker pool starts
+RESUMABLE_STATUSES = ("queued", "running")
+
+
+class LeaseLost(Exception):
+    """Another worker has taken over the job, so this one must stop working on it."""
+
+
+class JobStore:
+    """SQLite-backed store for script generation jobs and their per-part checkpoints."""
+
+    def __init__(self, db_path: str):
+        # Every worker process opens the same file; wait for the write lock instead of failing
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, "
+            "paragraphs TEXT NOT NULL DEFAULT '[]', parts_done INTEGER NOT NULL DEFAULT 0, "
+            "total_parts INTEGER NOT NULL DEFAULT 0, total_words INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, usage TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "owner TEXT, lease_until REAL NOT NULL DEFAULT 0, continuation TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # Stores created before jobs were leased to a worker process
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._db.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+        if "continuation" not in columns:
+            # Stores created before the continuation budgets were checkpointed
+            self._db.execute("ALTER TABLE jobs ADD COLUMN continuation TEXT")
+        self._db.commit()
+
+    async def create(self, request: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await self._execute(
+            "INSERT INTO jobs (id, status, request, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(request), now, now)
+        )
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        rows = await self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    async def resumable(self) -> list[str]:
+        """Unfinished jobs that no live worker holds a lease on."""
+        rows = await self._query(
+            f"SELECT id FROM jobs WHERE status IN ({', '.join('?' for _ in RESUMABLE_STATUSES)}) "
+            "AND lease_until < ? ORDER BY created_at",
+            (*RESUMABLE_STATUSES, time.time())
+        )
+        return [row["id"] for row in rows]
+
+    async def claim(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Lease an unfinished job to ``owner``; False if another worker holds a live lease on it."""
+        now = time.time()
+        claimed = await self._execute(
+            f"UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ? "
+            f"AND status IN ({', '.join('?' for _ in RESUMABLE_STATUSES)}) "
+            "AND (owner IS NULL OR owner = ? OR lease_until < ?)",
+            (owner, now + lease_seconds, job_id, *RESUMABLE_STATUSES, owner, now)
+        )
+        return claimed > 0
+
+    async def renew(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extend the lease; False if ``owner`` no longer holds it."""
+        renewed = await self._execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ?",
+            (time.time() + lease_seconds, job_id, owner)
+        )
+        return renewed > 0
+
+    async def release(self, job_id: str, owner: str):
+        """Give up the lease so another worker, or this one after a restart, resumes the job."""
+        await self._execute(
+            "UPDATE jobs SET owner = NULL, lease_until = 0 WHERE id = ? AND owner = ?",
+            (job_id, owner)
+        )
+
+    async def mark_running(self, job_id: str, owner: str, total_parts: int):
+        await self._update_owned(job_id, owner, "status = 'running', total_parts = ?", (total_parts,))
+
+    async def checkpoint(self, job_id: str, owner: str, paragraphs: list, parts_done: int, total_words: int, continuation: dict = None):
+        await self._update_owned(
+            job_id, owner,
+            "paragraphs = ?, parts_done = ?, total_words = ?, continuation = ?",
+            (json.dumps(paragraphs), parts_done, total_words, json.dumps(continuation) if continuation else None)
+        )
+
+    async def finish(self, job_id: str, owner: str, paragraphs: list, total_words: int, usage: dict):
+        await self._update_owned(
+            job_id, owner,
+            "status = 'completed', paragraphs = ?, total_words = ?, usage = ?",
+            (json.dumps(paragraphs), total_words, json.dumps(usage))
+        )
+
+    async def fail(self, job_id: str, owner: str, error: str):
+        await self._update_owned(job_id, owner, "status = 'failed', error = ?", (error,))
+
+    async def _update_owned(self, job_id: str, owner: str, assignments: str, params: tuple):
+        """Update a job only while ``owner`` holds its lease; raises LeaseLost otherwise."""
+        updated = await self._execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND owner = ?",
+            (*params, time.time(), job_id, owner)
+        )
+        if updated == 0:
+            raise LeaseLost(f"Job {job_id} is no longer leased to {owner}")
+
+    async def _execute(self, sql: str, params: tuple) -> int:
+        return await asyncio.to_thread(self._execute_sync, sql, params)
+
+    async def _query(self, sql: str, params: tuple) -> list[dict]:
+        return await asyncio.to_thread(self._query_sync, sql, params)
+
+    def _execute_sync(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor.rowcount
+
+    def _query_sync(self, sql: str, params: tuple) -> list[dict]:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class JobManager:
+    """Runs script generation jobs on a bounded pool of background workers.
+
+    Progress is checkpointed after every finished part, so a job interrupted by
+    a restart resumes from its last completed part instead of starting over.
+    Each job is leased to one worker process while it runs, and the lease is
+    renewed on a timer for as long as it does, so several server processes can
+    share a store; jobs whose lease has expired (their process died) are picked
+    up again by a periodic scan. A worker that finds its lease taken over stops
+    the job without writing to it.
+    """
+
+    def __init__(self, service, store: JobStore, workers: int = 2, lease_seconds: float = 600):
+        self.service = service
+        self.store = store
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._tasks = []
+        self._active = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._draining = False
+
+    async def start(self):
+        await self._enqueue_resumable()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaim_loop()))
+
+    async def stop(self, drain_timeout: float = 0):
+        """Stop the workers, first giving running jobs up to ``drain_timeout`` seconds to finish.
+
+        Jobs still running after that are cancelled and released; they keep
+        their checkpoint and resume on the next start.
+        """
+        self._draining = True
+        if self._active and drain_timeout > 0:
+            logger.info(f"Draining {len(self._active)} running job(s) for up to {drain_timeout:.0f}s")
+            try:
+                await asyncio.wait_for(self._idle.wait(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Releasing {len(self._active)} unfinished job(s) for resumption")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, request: dict) -> str:
+        job_id = await self.store.create(request)
+        if not self._draining:
+            # While draining the job stays queued in the store for another worker
+            self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued and job_id not in self._active:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _enqueue_resumable(self):
+        for job_id in await self.store.resumable():
+            if job_id not in self._queued and job_id not in self._active:
+                logger.info(f"Resuming job {job_id}")
+                self._enqueue(job_id)
+
+    async def _reclaim_loop(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 4)
+            try:
+                await self._enqueue_resumable()
+            except Exception as e:
+                logger.warning(f"Failed to scan for orphaned jobs: {e}")
+
+    async def _worker(self):
+        while not self._draining:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                if self._draining or not await self.store.claim(job_id, self.owner, self.lease_seconds):
+                    continue
+                self._active.add(job_id)
+                self._idle.clear()
+                try:
+                    await self._run_leased(job_id)
+                except asyncio.CancelledError:
+                    await asyncio.shield(self.store.release(job_id, self.owner))
+                    raise
+                except LeaseLost as e:
+                    logger.warning(f"Stopped job {job_id}: {e}")
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed: {e}")
+                    try:
+                        await self.store.fail(job_id, self.owner, str(e))
+                    except LeaseLost:
+                        logger.warning(f"Job {job_id} was taken over by another worker; not marking it failed")
+                finally:
+                    self._active.discard(job_id)
+                    if not self._active:
+                        self._idle.set()
+            finally:
+                self._queue.task_done()
+
+    async def _run_leased(self, job_id: str):
+        """Run a claimed job, renewing its lease until the job ends; stop it if the lease is lost."""
+        run = asyncio.ensure_future(self._run(job_id))
+        try:
+            while True:
+                done, _ = await asyncio.wait({run}, timeout=self.lease_seconds / 3)
+                if done:
+                    return run.result()
+                if not await self.store.renew(job_id, self.owner, self.lease_seconds):
+                    raise LeaseLost(f"Job {job_id} is no longer leased to {self.owner}")
+        finally:
+            if not run.done():
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+
+    async def _run(self, job_id: str):
+        job = await self.store.get(job_id)
+        if job is None or job["status"] not in RESUMABLE_STATUSES:
+            return
+        request = json.loads(job["request"])
+        paragraphs = json.loads(job["paragraphs"])
+        parts_done = job["parts_done"]
+        total_words = job["total_words"]
+        with track_usage() as usage:
+            async for event in self.service.generate_script_stream(
+                request["title"],
+                request["word_count"],
+                request.get("forbidden_words", []),
+                request.get("inspirational_transcript"),
+                request.get("structure_prompt", ""),
+                use_cache=not request.get("bypass_cache", False),
+                paragraphs=paragraphs,
+                start_part=parts_done,
+                continuation=json.loads(job["continuation"]) if job["continuation"] else None
+            ):
+                if event["event"] == "start":
+                    await self.store.mark_running(job_id, self.owner, event["parts"])
+                elif event["event"] == "paragraph":
+                    paragraphs.append(event["text"])
+                    total_words = event["total_words"]
+                elif event["event"] == "part_complete":
+                    parts_done = event["part"] + 1
+                    await self.store.checkpoint(job_id, self.owner, paragraphs, parts_done, total_words, event["continuation"])
+                elif event["event"] == "error":
+                    raise RuntimeError(event["detail"])
+        await self.store.finish(job_id, self.owner, paragraphs, total_words, usage)
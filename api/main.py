@@ -1,12 +1,66 @@
 import fastapi
+import json
+import logging
+from fastapi import status
 from fastapi.middleware.cors import CORSMiddleware
-from .models import ScriptRequest, ScriptResponse, ParagraphRequest
-from .services import AnthropicService
-from .config import CORS_ORIGINS
-from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from .models import (
+    ScriptRequest,
+    ScriptResponse,
+    ParagraphRequest,
+    JobSubmitResponse,
+    JobStatusResponse,
+    RegenerateSegmentRequest,
+    BatchRegenerateRequest,
+    BatchRegenerateResponse,
+    SessionCreateRequest,
+    SessionResponse,
+    SessionDetailResponse,
+    SessionUpdateResponse,
+    SessionContinueRequest,
+    SessionRegenerateRequest,
+    ParagraphEditRequest,
+)
+from . import clients
+from .services import AnthropicService, MAX_WORDS_PER_REQUEST
+from .jobs import JobManager, JobStore
+from .sessions import ScriptSessions, SessionStore
+from .config import (
+    CORS_ORIGINS,
+    JOB_DB_PATH,
+    JOB_WORKERS,
+    JOB_LEASE_SECONDS,
+    SESSION_DB_PATH,
+    SESSION_TTL_SECONDS,
+    METRICS_LOG_SAMPLE_RATE,
+    SHUTDOWN_DRAIN_SECONDS,
+    COMPRESSION_MINIMUM_SIZE,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_BROTLI_QUALITY,
+    REQUEST_MAX_DECOMPRESSED_BYTES,
+)
+from .usage import track_usage
+from .metrics import RequestMetricsMiddleware, configure_logging, render_metrics
+from .compression import CompressionMiddleware
+from fastapi import HTTPException, Request
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
+# orjson renders the validated response models several times faster than the stdlib encoder
+app = fastapi.FastAPI(default_response_class=ORJSONResponse)
 
-app = fastapi.FastAPI()
+# Request ids, latency histograms and sampled structured request logs
+app.add_middleware(RequestMetricsMiddleware, log_sample_rate=METRICS_LOG_SAMPLE_RATE)
+
+# Negotiated brotli/gzip responses and gzip/deflate request bodies
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    max_request_size=REQUEST_MAX_DECOMPRESSED_BYTES
+)
 
 
 # Add CORS middleware
@@ -23,37 +77,170 @@ app.add_middleware(
 # Initialize Anthropic service
 anthropic_service = AnthropicService()
 
+# Background worker pool for long generations submitted through /jobs
+job_manager = JobManager(anthropic_service, JobStore(JOB_DB_PATH), workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS)
+
+# Server-side scripts addressed by session id and paragraph index
+script_sessions = ScriptSessions(
+    anthropic_service,
+    SessionStore(SESSION_DB_PATH, ttl_seconds=SESSION_TTL_SECONDS),
+    max_words_per_request=MAX_WORDS_PER_REQUEST
+)
+
+@app.on_event("startup")
+async def startup():
+    # Warm up in the background so the server starts accepting (and answering /healthz) at once;
+    # /readyz reports not ready until the client is built and its pool primed
+    clients.start_warm_up()
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # The server has already drained in-flight requests; give running jobs the same grace period
+    await job_manager.stop(drain_timeout=SHUTDOWN_DRAIN_SECONDS)
+    await anthropic_service.close()
+
 @app.get("/")
 async def root():
     return {"message": "Script Generator API"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving its event loop."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model client is built and its connection pool primed."""
+    state = clients.readiness()
+    if not state["ready"]:
+        # Try again after a failed warm-up; a no-op while one is running or the key is missing
+        clients.start_warm_up()
+        return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable" if state["error"] else "starting", **state})
+    return {"status": "ready", **state}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if anthropic_service.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **anthropic_service.cache.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
+
 @app.post("/generate-script", response_model=ScriptResponse)
 async def generate_script(request: ScriptRequest):
-    result = await anthropic_service.generate_script(
-        request.title,
-        request.word_count,
-        request.forbidden_words,
-        request.inspirational_transcript,
-        request.structure_prompt
-    )
-    # If not enough words, continue the story
-    while not result["completed"] and result["remaining_words"] > 0:
-        result = await anthropic_service.continue_script(
+    with track_usage() as usage:
+        result = await anthropic_service.generate_full_script(
             request.title,
-            request.inspirational_transcript,
+            request.word_count,
             request.forbidden_words,
+            request.inspirational_transcript,
             request.structure_prompt,
-            result["paragraphs"],
-            result["remaining_words"]
+            mode=request.generation_mode,
+            smooth_transitions=request.smooth_transitions,
+            use_cache=not request.bypass_cache
         )
+    result["usage"] = usage
     return result
 
 
+def _require_sequential(request: ScriptRequest):
+    """Streams and jobs write parts one after another; reject modes they would otherwise ignore."""
+    if request.generation_mode != "sequential":
+        raise HTTPException(
+            status_code=400,
+            detail=f"generation_mode {request.generation_mode!r} is only supported by /generate-script"
+        )
+
+
+def _format_event(event: dict, sse: bool) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.post("/generate-script/stream")
+async def generate_script_stream(request: ScriptRequest, http_request: Request):
+    """Stream paragraphs and progress events as NDJSON, or SSE when the client accepts text/event-stream."""
+    _require_sequential(request)
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    async def event_stream():
+        with track_usage() as usage:
+            async for event in anthropic_service.generate_script_stream(
+                request.title,
+                request.word_count,
+                request.forbidden_words,
+                request.inspirational_transcript,
+                request.structure_prompt,
+                use_cache=not request.bypass_cache
+            ):
+                if event["event"] == "done":
+                    event["usage"] = usage
+                yield _format_event(event, sse)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/jobs/generate-script", response_model=JobSubmitResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_generate_script_job(request: ScriptRequest):
+    _require_sequential(request)
+    job_id = await job_manager.submit(request.model_dump())
+    return {"job_id": job_id, "status": "queued"}
+
+
+async def _get_job(job_id: str) -> dict:
+    job = await job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    job = await _get_job(job_id)
+    target_words = json.loads(job["request"])["word_count"]
+    # The stored count also includes continuation rounds, which come after the planned parts
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "parts_done": min(job["parts_done"], job["total_parts"]),
+        "total_parts": job["total_parts"],
+        "continuation_rounds": max(0, job["parts_done"] - job["total_parts"]),
+        "total_words": job["total_words"],
+        "target_words": target_words,
+        "remaining_words": max(0, target_words - job["total_words"]),
+        "error": job["error"]
+    }
+
+
+@app.get("/jobs/{job_id}/result", response_model=ScriptResponse)
+async def get_job_result(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {
+        "paragraphs": json.loads(job["paragraphs"]),
+        "total_words": job["total_words"],
+        "usage": json.loads(job["usage"]) if job["usage"] else None
+    }
+
+
 @app.post("/regenerate-segment")
 async def regenerate_segment(request: dict):
     try:
-        # Log the incoming request for debugging
-        print("Received regenerate segment request:", request)
+        logger.debug("Received regenerate segment request: %s", request)
         
         # Validate required fields
         required_fields = ["title", "context_before", "context_after", "segment_word_count"]
@@ -61,23 +248,145 @@ async def regenerate_segment(request: dict):
         if missing_fields:
             raise HTTPException(status_code=400, detail=f"Missing required fields: {', '.join(missing_fields)}")
 
-        result = anthropic_service.regenerate_segment(
-            title=request.get("title"),
-            inspirational_transcript=request.get("inspirational_transcript"),
-            forbidden_words=request.get("forbidden_words", []),
-            structure_prompt=request.get("structure_prompt", ""),
-            context_before=request.get("context_before", ""),
-            context_after=request.get("context_after", ""),
-            segment_word_count=request.get("segment_word_count", 500)
-        )
-        
-        # Log the result for debugging
-        print("Regenerate segment result:", result)
-        
+        # Type-check the body; validation errors are ValueErrors and map to 400
+        segment = RegenerateSegmentRequest.model_validate(request)
+
+        with track_usage() as usage:
+            result = await anthropic_service.regenerate_segment(
+                title=segment.title,
+                inspirational_transcript=segment.inspirational_transcript,
+                forbidden_words=segment.forbidden_words,
+                structure_prompt=segment.structure_prompt,
+                context_before=segment.context_before,
+                context_after=segment.context_after,
+                segment_word_count=segment.segment_word_count,
+                use_cache=not segment.bypass_cache
+            )
+        result["usage"] = usage
+        logger.debug("Regenerate segment result: %s", result)
         return result
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print("Error in regenerate_segment:", str(e))  # Add logging
+        logger.exception("Error in regenerate_segment")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/regenerate-segments", response_model=BatchRegenerateResponse)
+async def regenerate_segments(request: BatchRegenerateRequest):
+    """Regenerate many segments concurrently; set "stream" to receive NDJSON lines as each one finishes.
+
+    A streamed batch ends with a {"usage": {...}} line once every segment is done.
+    """
+    results = anthropic_service.regenerate_segments(
+        [segment.model_dump() for segment in request.segments],
+        title=request.title,
+        inspirational_transcript=request.inspirational_transcript,
+        forbidden_words=request.forbidden_words,
+        structure_prompt=request.structure_prompt,
+        use_cache=not request.bypass_cache
+    )
+
+    if request.stream:
+        async def result_stream():
+            with track_usage() as usage:
+                async for result in results:
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+            # The last line carries the token usage of the whole batch
+            yield json.dumps({"usage": usage}) + "\n"
+
+        return StreamingResponse(
+            result_stream(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    ordered = [None] * len(request.segments)
+    with track_usage() as usage:
+        async for result in results:
+            ordered[result["index"]] = result
+    return {"results": ordered, "usage": usage}
+
+
+def _session_response(session: dict, paragraphs: list = None, usage: dict = None) -> dict:
+    response = {
+        "session_id": session["id"],
+        "title": session["title"],
+        "word_count": session["word_count"],
+        "paragraph_count": session["paragraph_count"],
+        "total_words": session["total_words"],
+        "remaining_words": max(0, session["word_count"] - session["total_words"])
+    }
+    if paragraphs is not None:
+        response["paragraphs"] = paragraphs
+    if usage is not None:
+        response["usage"] = usage
+    return response
+
+
+def _session_or_404(result, detail: str = "Session not found"):
+    if result is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return result
+
+
+@app.post("/sessions", response_model=SessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_session(request: SessionCreateRequest):
+    session = await script_sessions.store.create(
+        request.title,
+        request.word_count,
+        transcript=request.inspirational_transcript,
+        forbidden_words=request.forbidden_words,
+        structure_prompt=request.structure_prompt,
+        paragraphs=request.paragraphs
+    )
+    return _session_response(session)
+
+
+@app.get("/sessions/{session_id}", response_model=SessionDetailResponse)
+async def get_session(session_id: str):
+    session = _session_or_404(await script_sessions.store.get(session_id))
+    return _session_response(session, await script_sessions.store.paragraphs(session_id))
+
+
+@app.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str):
+    if not await script_sessions.store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@app.post("/sessions/{session_id}/continue", response_model=SessionUpdateResponse)
+async def continue_session(session_id: str, request: SessionContinueRequest):
+    with track_usage() as usage:
+        result = _session_or_404(await script_sessions.continue_script(
+            session_id,
+            word_count=request.word_count,
+            use_cache=not request.bypass_cache
+        ))
+    return _session_response(result["session"], result["paragraphs"], usage)
+
+
+@app.put("/sessions/{session_id}/paragraphs/{index}", response_model=SessionUpdateResponse)
+async def edit_session_paragraph(session_id: str, index: int, request: ParagraphEditRequest):
+    result = _session_or_404(
+        await script_sessions.edit_paragraph(session_id, index, request.text),
+        detail="Session or paragraph not found"
+    )
+    return _session_response(result["session"], result["paragraphs"])
+
+
+@app.post("/sessions/{session_id}/paragraphs/{index}/regenerate", response_model=SessionUpdateResponse)
+async def regenerate_session_paragraph(session_id: str, index: int, request: SessionRegenerateRequest):
+    with track_usage() as usage:
+        result = _session_or_404(
+            await script_sessions.regenerate_paragraph(
+                session_id,
+                index,
+                segment_word_count=request.segment_word_count,
+                use_cache=not request.bypass_cache
+            ),
+            detail="Session or paragraph not found"
+        )
+    return _session_response(result["session"], result["paragraphs"], usage)
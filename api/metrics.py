@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from starlette.routing import Match
+
+from .usage import track_usage
+
+request_logger = logging.getLogger("api.requests")
+
+# Id of the request being served, attached to every log record
+request_id_var = ContextVar("request_id", default="-")
+# Extra per-request facts (e.g. continuation rounds) added to the structured request log
+_annotations = ContextVar("request_annotations", default=None)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, including streamed bodies",
+    ["method", "endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+MODEL_CALL_SECONDS = Histogram(
+    "model_call_duration_seconds", "Wall time of a model call",
+    ["task", "model", "outcome"], buckets=LATENCY_BUCKETS
+)
+MODEL_FIRST_TOKEN_SECONDS = Histogram(
+    "model_first_token_seconds", "Time to the first streamed token of a model call",
+    ["task", "model"], buckets=LATENCY_BUCKETS
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total", "Tokens reported in model response usage",
+    ["task", "model", "kind"]
+)
+SCRIPT_PART_SECONDS = Histogram(
+    "script_part_duration_seconds", "Time to generate one planned script part",
+    ["part"], buckets=LATENCY_BUCKETS
+)
+CONTINUATION_ROUNDS = Histogram(
+    "script_continuation_rounds", "Continuation rounds needed per script",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12)
+)
+JSON_PARSE_FALLBACKS = Counter(
+    "model_json_parse_fallbacks_total", "Model outputs that could not be parsed as the requested JSON",
+    ["task"]
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total", "Response cache lookups", ["result"]
+)
+FORBIDDEN_WORD_PARAGRAPHS = Counter(
+    "forbidden_word_paragraphs_total", "Generated paragraphs that contained forbidden words", ["task"]
+)
+FORBIDDEN_WORD_REPAIRS = Counter(
+    "forbidden_word_repairs_total", "Paragraph repairs for forbidden words", ["outcome"]
+)
+MODEL_RETRIES = Counter("model_call_retries_total", "Model calls retried after a transient error", ["error"])
+MODEL_COALESCED = Counter("model_calls_coalesced_total", "Model calls served by an identical in-flight call")
+MODEL_FALLBACKS = Counter("model_fallbacks_total", "Model calls moved to a fallback model because theirs was overloaded", ["model", "fallback"])
+# Hedge rate is model_hedges_total / model_hedge_eligible_calls_total; win rate is the share with winner="hedge"
+MODEL_HEDGE_ELIGIBLE = Counter("model_hedge_eligible_calls_total", "Model calls that could be hedged", ["task"])
+MODEL_HEDGES = Counter("model_hedges_total", "Hedge calls launched, by which call finished first", ["task", "winner"])
+MODEL_HEDGES_DENIED = Counter("model_hedges_denied_total", "Slow calls not hedged because the hedge budget was spent", ["task"])
+
+_USAGE_KINDS = {
+    "input_tokens": "input",
+    "cache_creation_input_tokens": "cache_write",
+    "cache_read_input_tokens": "cache_read",
+    "output_tokens": "output",
+}
+
+
+def observe_model_call(task: str, model: str, seconds: float, outcome: str, usage: dict = None):
+    MODEL_CALL_SECONDS.labels(task, model, outcome).observe(seconds)
+    for field, kind in _USAGE_KINDS.items():
+        if usage and usage.get(field):
+            MODEL_TOKENS.labels(task, model, kind).inc(usage[field])
+
+
+def observe_first_token(task: str, model: str, seconds: float):
+    MODEL_FIRST_TOKEN_SECONDS.labels(task, model).observe(seconds)
+
+
+def observe_part(index: int, seconds: float):
+    SCRIPT_PART_SECONDS.labels(str(index) if index < 10 else "10+").observe(seconds)
+
+
+def observe_continuation_rounds(rounds: int):
+    CONTINUATION_ROUNDS.observe(rounds)
+    annotate("continuation_rounds", rounds)
+
+
+def count_parse_fallback(task: str):
+    JSON_PARSE_FALLBACKS.labels(task).inc()
+    annotate("json_parse_fallbacks", (_current_annotations().get("json_parse_fallbacks") or 0) + 1)
+
+
+def count_forbidden_repair(task: str, repaired: bool):
+    FORBIDDEN_WORD_PARAGRAPHS.labels(task).inc()
+    FORBIDDEN_WORD_REPAIRS.labels("repaired" if repaired else "unresolved").inc()
+    annotate("forbidden_word_repairs", (_current_annotations().get("forbidden_word_repairs") or 0) + 1)
+
+
+def count_cache_lookup(hit: bool):
+    RESPONSE_CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def annotate(key: str, value):
+    """Attach a value to the structured log line of the current request."""
+    annotations = _annotations.get()
+    if annotations is not None:
+        annotations[key] = value
+
+
+def _current_annotations() -> dict:
+    return _annotations.get() or {}
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus exposition; aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def configure_logging():
+    """Prefix every log line with the id of the request that produced it."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=logging.INFO)
+    for handler in root.handlers:
+        handler.addFilter(RequestIdFilter())
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware that times every request, tags it with a request id and
+    writes a sampled structured log line with its token usage.
+
+    Implemented as plain ASGI (not BaseHTTPMiddleware) so the timing covers
+    streamed response bodies and the context reaches the endpoint.
+    """
+
+    def __init__(self, app, log_sample_rate: float = 1.0):
+        self.app = app
+        self.log_sample_rate = log_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        id_token = request_id_var.set(request_id)
+        annotations_token = _annotations.set({})
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with track_usage() as usage:
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            endpoint = self._endpoint(scope)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], endpoint, str(status_code)).observe(elapsed)
+            if status_code >= 500 or random.random() < self.log_sample_rate:
+                request_logger.info(json.dumps({
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "endpoint": endpoint,
+                    "status": status_code,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "usage": usage,
+                    **_current_annotations()
+                }))
+            _annotations.reset(annotations_token)
+            request_id_var.reset(id_token)
+
+    @staticmethod
+    def _endpoint(scope) -> str:
+        # Label by route template so path parameters do not explode cardinality
+        app = scope.get("app")
+        for route in getattr(app, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
@@ -1,18 +1,121 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 
 class ScriptRequest(BaseModel):
     title: str
     inspirational_transcript: Optional[str] = None
-    word_count: int
+    word_count: int = Field(gt=0)
     forbidden_words: List[str] = []
     structure_prompt: str = ''
+    # "outline" plans the story first and writes all parts concurrently
+    generation_mode: Literal["sequential", "outline"] = "sequential"
+    smooth_transitions: bool = False
+    # Skip cached completions and always call the model
+    bypass_cache: bool = False
 
 class ScriptResponse(BaseModel):
     paragraphs: List[str]
     total_words: int
+    # Input tokens split into uncached, cache-write and cache-read counts, plus output tokens
+    usage: Optional[Dict[str, int]] = None
+    # True when a continuation budget stopped generation short of word_count
+    partial: bool = False
+    stop_reason: Optional[str] = None
 
 class ParagraphRequest(BaseModel):
     paragraph_index: int
     context: str
-    old_paragraph: str 
\ No newline at end of file
+    old_paragraph: str 
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    # Planned parts; continuation rounds run after all of them are done
+    parts_done: int
+    total_parts: int
+    continuation_rounds: int = 0
+    total_words: int
+    target_words: int
+    remaining_words: int
+    error: Optional[str] = None
+
+class SegmentContext(BaseModel):
+    context_before: str
+    context_after: str
+    segment_word_count: int = Field(gt=0)
+
+class RegenerateSegmentRequest(SegmentContext):
+    title: str
+    inspirational_transcript: Optional[str] = None
+    forbidden_words: List[str] = []
+    structure_prompt: str = ''
+    bypass_cache: bool = False
+
+class BatchRegenerateRequest(BaseModel):
+    # Script-level fields are sent once and shared by every segment in the batch
+    title: str
+    inspirational_transcript: Optional[str] = None
+    forbidden_words: List[str] = []
+    structure_prompt: str = ''
+    bypass_cache: bool = False
+    segments: List[SegmentContext] = Field(min_length=1, max_length=50)
+    # Return NDJSON lines as each segment finishes instead of one ordered response,
+    # followed by a final {"usage": ...} line
+    stream: bool = False
+
+class SegmentResult(BaseModel):
+    index: int
+    content: Optional[str] = None
+    wordCount: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchRegenerateResponse(BaseModel):
+    results: List[SegmentResult]
+    usage: Optional[Dict[str, int]] = None
+
+class SessionCreateRequest(BaseModel):
+    title: str
+    word_count: int = Field(gt=0)
+    inspirational_transcript: Optional[str] = None
+    forbidden_words: List[str] = []
+    structure_prompt: str = ''
+    # An existing script to edit; omit to start empty and fill it with /continue
+    paragraphs: List[str] = []
+
+class SessionParagraph(BaseModel):
+    index: int
+    text: str
+    words: int
+
+class SessionResponse(BaseModel):
+    session_id: str
+    title: str
+    word_count: int
+    paragraph_count: int
+    total_words: int
+    remaining_words: int
+
+class SessionDetailResponse(SessionResponse):
+    paragraphs: List[SessionParagraph]
+
+class SessionUpdateResponse(SessionResponse):
+    # Only the paragraphs added or changed by the call
+    paragraphs: List[SessionParagraph]
+    usage: Optional[Dict[str, int]] = None
+
+class SessionContinueRequest(BaseModel):
+    # Words to add; defaults to the next part towards the session's word_count
+    word_count: Optional[int] = Field(default=None, gt=0)
+    bypass_cache: bool = False
+
+class SessionRegenerateRequest(BaseModel):
+    # Defaults to the current length of the paragraph
+    segment_word_count: Optional[int] = Field(default=None, gt=0)
+    bypass_cache: bool = False
+
+class ParagraphEditRequest(BaseModel):
+    text: str
\ No newline at end of file
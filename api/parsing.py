@@ -0,0 +1,204 @@
+import json
+import re
+
+# Start of the JSON value; anything before it is chatter
+_OPENING = re.compile(r"[\[{]")
+# Characters that end a run of plain string content: a closing quote or an escape
+_STRING_SPECIAL = re.compile(r'["\\]')
+# Models occasionally emit raw newlines inside strings; accept them
+_DECODER = json.JSONDecoder(strict=False)
+# Blank lines separate paragraphs when the model ignored the JSON format
+_BLANK_LINES = re.compile(r"\n\s*\n")
+_CODE_FENCE = re.compile(r"^```[a-zA-Z]*\s*$", re.MULTILINE)
+
+# Object keys whose string values are paragraphs; other values are collected as fields
+TEXT_KEYS = ("content", "text", "paragraph", "paragraphs")
+
+
+class ParagraphStreamParser:
+    """Incrementally extract paragraphs from streamed model JSON output.
+
+    Understands a JSON array of strings as well as a JSON object such as
+    ``{"content": "...", "wordCount": 120}``. Every string element of an
+    array, and every string value of a key in ``text_keys``, is returned as
+    soon as its closing quote has been seen; the remaining object values are
+    collected in ``fields``. Chatter before the JSON and anything after it
+    (explanations, code fences) is ignored.
+
+    Output that contains no JSON at all is split into paragraphs on blank
+    lines by ``close()``, which also sets ``fallback``.
+    """
+
+    def __init__(self, text_keys=TEXT_KEYS):
+        self.text_keys = set(text_keys)
+        self.fields = {}
+        self.emitted = 0
+        self.fallback = False
+        self._buffer = ""
+        self._pos = 0
+        self._raw = []
+        # One entry per open container: [bracket, current key, expecting a key]
+        self._stack = []
+        self._in_string = False
+        self._string_start = 0
+        self._scalar = ""
+        self._done = False
+
+    def feed(self, chunk: str) -> list[str]:
+        """Consume a chunk of model output and return any completed paragraphs."""
+        if self._done or not chunk:
+            return []
+        if self.emitted == 0 and not self.fields:
+            # Kept until the first value is found, for the plain-text fallback
+            self._raw.append(chunk)
+        self._buffer += chunk
+        paragraphs = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and not self._done:
+            if not self._stack:
+                match = _OPENING.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                self._stack.append([match.group(), None, match.group() == "{"])
+                pos = match.end()
+            elif self._in_string:
+                match = _STRING_SPECIAL.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    # Need the escaped character before we can move past it
+                    if match.start() + 1 >= len(buffer):
+                        pos = match.start()
+                        break
+                    pos = match.start() + 2
+                    continue
+                self._in_string = False
+                pos = match.end()
+                paragraph = self._end_string(self._decode(buffer[self._string_start:match.start()]))
+                if paragraph:
+                    paragraphs.append(paragraph)
+            else:
+                self._consume_structural(buffer[pos])
+                if buffer[pos] == '"':
+                    self._string_start = pos + 1
+                pos += 1
+        # Drop consumed text so the buffer stays proportional to one paragraph
+        if self._in_string:
+            self._buffer = buffer[self._string_start:]
+            pos -= self._string_start
+            self._string_start = 0
+        else:
+            self._buffer = buffer[pos:]
+            pos = 0
+        self._pos = pos
+        self.emitted += len(paragraphs)
+        return paragraphs
+
+    def close(self) -> list[str]:
+        """Flush the parser at the end of the stream.
+
+        A string cut off by the token limit is returned as the last paragraph.
+        If no JSON value was found at all, the raw output is split on blank
+        lines so that no model output is lost or merged into one blob.
+        """
+        paragraphs = []
+        if self._in_string and self._role() == "text":
+            paragraph = self._decode_partial(self._buffer)
+            if paragraph:
+                paragraphs.append(paragraph)
+        elif self.emitted == 0 and not self.fields:
+            text = _CODE_FENCE.sub("", "".join(self._raw)).strip()
+            paragraphs = [part.strip() for part in _BLANK_LINES.split(text) if part.strip()]
+            self.fallback = bool(paragraphs)
+        self._buffer = ""
+        self._pos = 0
+        self._raw = []
+        self._stack = []
+        self._in_string = False
+        self._done = True
+        self.emitted += len(paragraphs)
+        return paragraphs
+
+    def parse(self, text: str) -> list[str]:
+        """Parse a complete model output."""
+        return self.feed(text) + self.close()
+
+    def _consume_structural(self, char: str):
+        top = self._stack[-1]
+        if char == '"':
+            self._in_string = True
+        elif char == ":":
+            top[2] = False
+        elif char == ",":
+            self._end_scalar()
+            if top[0] == "{":
+                top[1], top[2] = None, True
+        elif char in "[{":
+            self._scalar = ""
+            self._stack.append([char, top[1] if top[0] == "{" else None, char == "{"])
+        elif char in "]}":
+            self._end_scalar()
+            self._stack.pop()
+            if not self._stack:
+                if self.emitted or self.fields:
+                    self._done = True
+                # Otherwise this was bracketed chatter like "[Intro]"; keep looking for the JSON
+        elif not char.isspace():
+            self._scalar += char
+        else:
+            self._end_scalar()
+
+    def _role(self) -> str:
+        top = self._stack[-1]
+        if top[0] == "[":
+            # Arrays nested under a metadata key (e.g. "tags") are not paragraphs
+            return "text" if top[1] is None or top[1] in self.text_keys else "field"
+        if top[2]:
+            return "key"
+        return "text" if top[1] in self.text_keys else "field"
+
+    def _end_string(self, value: str):
+        role = self._role()
+        top = self._stack[-1]
+        if role == "key":
+            top[1] = value
+            return None
+        if role == "field":
+            if top[0] == "{":
+                self.fields[top[1]] = value
+            else:
+                self.fields.setdefault(top[1], []).append(value)
+            return None
+        return value.strip()
+
+    def _end_scalar(self):
+        if not self._scalar:
+            return
+        top = self._stack[-1]
+        if top[0] == "{" and top[1] is not None and not top[2]:
+            try:
+                self.fields[top[1]] = json.loads(self._scalar)
+            except ValueError:
+                self.fields[top[1]] = self._scalar
+        self._scalar = ""
+
+    @staticmethod
+    def _decode(raw: str) -> str:
+        try:
+            return _DECODER.decode(f'"{raw}"')
+        except ValueError:
+            return raw.replace('\\"', '"').replace('\\n', '\n').replace('\\t', '\t')
+
+    @classmethod
+    def _decode_partial(cls, raw: str) -> str:
+        # A truncated string may end in the middle of an escape sequence such as \u00e9
+        for cut in range(6):
+            try:
+                return _DECODER.decode(f'"{raw[:len(raw) - cut]}"').strip()
+            except ValueError:
+                continue
+        return cls._decode(raw).strip()
+
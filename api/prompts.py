@@ -1,42 +1,5 @@
-def generate_script_prompt(title: str, transcript: str, word_count: int, forbidden_words: list[str]) -> str:
-    prompt = f"""You are a professional scriptwriter with a talent for creating compelling, narration-friendly video scripts. Your task is to write a new script inspired by the tone, structure, and pacing of the following reference transcript.
-
-**Project Details**
-- **Title**: {title}
-- **Target Word Count**: {word_count}
-- **Forbidden Words**: {', '.join(forbidden_words) if forbidden_words else 'None'}
-
-**Reference Transcript**
-Use the transcript below as inspiration for structure, flow, and emotional impact. Do not copy it directly—use it as a creative foundation:
-{transcript}
-
-**Script Requirements**
-Please generate an original video script that:
-1. Mirrors the style and structure of the reference transcript
-2. Captures and holds viewer attention throughout
-3. Features smooth, natural transitions between ideas
-4. Has a clear and engaging beginning, middle, and end
-5. Is optimized for spoken delivery in a video format
-6. Completely avoids using any of the forbidden words
-7. Is approximately {word_count} words in total
-
-**Output Format**
-Return ONLY a valid JSON array of strings, where each string is a paragraph of the script.
-Do not include any blank lines, empty strings, or extra whitespace between array elements.
-Do not include any text before or after the JSON array.
-
-**Example Format**
-[
-    "This is the opening paragraph that sets the stage...",
-    "Here's a continuation that builds on the idea...",
-    "This paragraph drives the story toward the conclusion...",
-    "And here's a strong closing paragraph to wrap things up."
-]
-
-Ensure your response is properly formatted as a JSON array of strings only.
-
-The structure of the script should be:
-    Initial Setting & Disruption
+# Default beat list used when the request does not supply its own structure
+DEFAULT_STRUCTURE = """    Initial Setting & Disruption
 
     Establish peaceful everyday scene
     Introduce antagonist force
@@ -96,37 +59,211 @@ The structure of the script should be:
     Future threat teased
     Story potential continues
 """
-    prompt += (
-        "\nReturn ONLY a valid JSON array of strings, where each string is a paragraph of the script."
-        "\nDo not include any blank lines, empty strings, or extra whitespace between array elements."
-        "\nDo not include any text before or after the JSON array."
-        "\nExample: [\"Paragraph 1 text.\", \"Paragraph 2 text.\", ...]"
-    )
-    return prompt
 
 
-def generate_paragraph_prompt(context: str, index: int) -> str:
-    return f"""You are an expert script writer. Your task is to regenerate a specific paragraph in a video script.
+def format_forbidden_words(forbidden_words) -> str:
+    if not forbidden_words:
+        return "None"
+    return ", ".join(forbidden_words) if isinstance(forbidden_words, list) else str(forbidden_words)
 
-ONLY return a single JSON object with one field: "content", which contains the regenerated paragraph as a string.
 
-Do NOT include any introduction, explanation, or formatting before or after the JSON.
-Do NOT wrap the JSON string inside another JSON.
-Do NOT use markdown formatting (no ```json).
+# Built-in prompt templates, rendered by api/templates.TemplateRegistry. They use
+# str.format fields (literal braces are doubled) and can be overridden per deployment
+# or channel from PROMPT_TEMPLATES_PATH. Names ending in "_line" (and the section
+# fragments) are optional pieces that render to nothing when their input is empty.
+#
+# Prompts for AnthropicService are split into a stable prefix, identical for every
+# call about the same script and marked for provider-side prompt caching, and a
+# short variable suffix sent as the user message.
+DEFAULT_TEMPLATES = {
+    "system": "You are an expert script writer who creates engaging, well-structured video scripts.",
 
----
+    "default_structure": DEFAULT_STRUCTURE,
 
-Current script context:
+    "script_prefix": """**Project Context**
+Title: {title}
+Forbidden Words: {forbidden_words}
+
+{transcript_line}
+
+{structure_line}""",
+    "transcript_line": "Inspirational Transcript: {transcript}",
+    "structure_line": "Follow this structure: {structure_prompt}",
+
+    "part": """
+You are a professional, versatile scriptwriter for YouTube videos. Your task is to write a compelling, original script based on the video title in the project context.
+
+Target Word Count for this part: {part_word_count}
+
+Continue the story from the following context (if any):
 {context}
 
-Please regenerate paragraph {index + 1} with the following requirements:
-1. Create a completely new version that maintains the same key information but uses different wording and structure
-2. Keep the same tone and style as the surrounding paragraphs
-3. Ensure smooth transitions with the paragraphs before and after
-4. Make the new version more engaging and impactful
-5. Do NOT simply rephrase the existing paragraph - create something new while maintaining narrative consistency
+{cta_line}
+
+**Script Requirements:**
+- The script MUST be as close as possible to {part_word_count} words for this part. Do NOT generate fewer words. Do NOT exceed the word count by more than 5%.
+- The script should be divided into paragraphs, each as a string in a JSON array.
+- The script should be original and creative, using the title as inspiration.
+- The script should be suitable for narration and keep viewers engaged.
+- Never use any of the forbidden words.
+- Do NOT include any text before or after the JSON array. Return ONLY a valid JSON array of strings, where each string is a paragraph.
+
+**Example Output:**
+["Paragraph 1...", "Paragraph 2...", ...]
+""",
+    "part_cta_line": 'Include this call to action at a natural point in this part: "{cta}"',
+
+    "continuation": """
+You are a professional, versatile scriptwriter for YouTube videos. Continue the following story, making sure to add new content and not repeat or summarize previous parts. Do not end the story until the word count is met.
+
+Target Word Count for this part: {part_word_count}
+
+Continue the story from the following context:
+{context}
+
+**Script Requirements:**
+- Continue the story, do not repeat or summarize previous content.
+- The script MUST be as close as possible to {part_word_count} words for this part. Do NOT generate fewer words. Do NOT exceed the word count by more than 5%.
+- The script should be divided into paragraphs, each as a string in a JSON array.
+- The script should be original, not copying the transcript, but using it for pacing, style, and structure.
+- The script should be suitable for narration and keep viewers engaged.
+- Never use any of the forbidden words.
+- Do NOT include any text before or after the JSON array. Return ONLY a valid JSON array of strings, where each string is a paragraph.
+
+**Example Output:**
+["Paragraph 1...", "Paragraph 2...", ...]
+""",
+
+    "outline": """You are a professional scriptwriter planning a narration-friendly video script for the project above.
+
+Target Word Count: {word_count}
+Number of Sections: {num_sections}
+
+{structure_section}
+
+Write a compact outline that splits the whole story into exactly {num_sections} consecutive sections of roughly equal length.
+Each section must be 2-4 sentences naming the events, characters and the state of the story at the end of the section, so that each section can be written independently and still connect to its neighbours.
 
-Return format:
-{{"content": "The new paragraph text goes here."}}
+Return ONLY a valid JSON array of exactly {num_sections} strings, one per section, in story order.
+Do not include any text before or after the JSON array.""",
+    "outline_structure_from_context": "Use the structure from the project context.",
+    "outline_default_structure": "**Story Structure**\n{default_structure}",
 
-Make sure the JSON is strictly valid and not nested inside another object or surrounded by any commentary."""
+    "outline_section": """
+You are a professional, versatile scriptwriter for YouTube videos. You are writing one section of a longer script; the other sections are being written separately from the same outline.
+
+Target Word Count for this section: {part_word_count}
+
+Full story outline:
+{outline_text}
+
+Write ONLY section {section_number}: {section_summary}
+{opening_line}
+{closing_line}
+
+{cta_line}
+
+**Script Requirements:**
+- The section MUST be as close as possible to {part_word_count} words. Do NOT generate fewer words. Do NOT exceed the word count by more than 5%.
+- The section should be divided into paragraphs, each as a string in a JSON array.
+- The script should be original and creative, using the title as inspiration.
+- The script should be suitable for narration and keep viewers engaged.
+- Never use any of the forbidden words.
+- Do NOT include any text before or after the JSON array. Return ONLY a valid JSON array of strings, where each string is a paragraph.
+
+**Example Output:**
+["Paragraph 1...", "Paragraph 2...", ...]
+""",
+    "section_opening_first": "Open the script with a strong hook.",
+    "section_opening_next": "Pick up exactly where section {previous_section} ends, without recapping it.",
+    "section_closing_last": "Bring the story to a satisfying close.",
+    "section_closing_next": "Stop where section {next_section} begins, without covering its events.",
+    "section_cta_line": 'Include this call to action at a natural point in this section: "{cta}"',
+
+    "transition": """You are a script editor. Two sections of a narration script were written separately. Rewrite the opening paragraph of the second section so it follows naturally from the closing paragraph of the first.
+
+Closing paragraph of the first section:
+{previous_paragraph}
+
+Opening paragraph of the second section:
+{next_paragraph}
+
+Keep the same events, facts and approximate length. Only adjust wording and add a bridge where needed; do not repeat the closing paragraph.
+
+Return ONLY a valid JSON object with one field, "content", containing the rewritten paragraph.
+Example format:
+{{"content": "The rewritten paragraph goes here."}}""",
+
+    "regenerate": """You are a professional scriptwriter. Your task is to regenerate a segment of the video script described in the project context.
+
+Current script context before the segment:
+{context_before}
+
+Current script context after the segment:
+{context_after}
+
+Please generate a new segment that:
+1. Maintains narrative consistency with the surrounding context
+2. Has approximately {segment_word_count} words
+3. Follows the same style and tone as the rest of the script
+4. Creates smooth transitions with the paragraphs before and after
+5. Is optimized for spoken delivery
+6. Never uses any of the forbidden words
+
+Return ONLY a valid JSON object with two fields:
+1. "content": The regenerated segment text
+2. "wordCount": The number of words in the segment
+
+Example format:
+{{"content": "The segment text goes here.", "wordCount": 500}}
+
+Make sure the JSON is strictly valid and not nested inside another object or surrounded by any commentary.""",
+
+    "repair": """You are a script editor. The paragraph below uses words that are not allowed in this script.
+
+Paragraph:
+{paragraph}
+
+Words and phrases to remove: {violations}
+
+Rewrite the paragraph without any of these words or phrases, including other capitalizations. Keep the same meaning, events, tone and approximate length, and change as little as possible.
+
+Return ONLY a valid JSON object with one field, "content", containing the rewritten paragraph.
+Example format:
+{{"content": "The rewritten paragraph goes here."}}""",
+}
+
+# Calls to action woven into the script: "intro" for the opening part, "schedule" for
+# later parts by the word at which they start (the last entry at or below it applies,
+# none before the first), and "end" as the closing paragraph. One variant is picked per
+# script, seeded by the title, so identical requests build identical prompts.
+DEFAULT_CTAS = {
+    "intro": [
+        "Before we jump back in, let us know where you're watching from, and if this story resonates, hit subscribe—tomorrow, something special awaits!",
+        "Pause for a moment—comment your location and subscribe if this story moves you. Tomorrow, we've got a treat lined up!",
+        "Share where you're tuning in from, and if this story speaks to you, subscribe for more—tomorrow brings something unique!"
+    ],
+    "schedule": [
+        {
+            "from_words": 1500,
+            "variants": [
+                "Crafting and narrating this tale took time—if you're enjoying it, please subscribe. Your support means the world! Now, back to the story.",
+                "If you're finding this story engaging, consider subscribing to our channel. It helps us a lot! Let's continue.",
+                "Enjoying the journey so far? Subscribe to support us, and let's dive back in!"
+            ]
+        },
+        {
+            "from_words": 6000,
+            "variants": [
+                "Still with us? Don't forget to subscribe for more stories like this!",
+                "If you're enjoying the video so far, hit that subscribe button!",
+                "Liking the story? Make sure to subscribe so you never miss an update!"
+            ]
+        }
+    ],
+    "end": [
+        "Up next, two more standout stories await. If this one hit the mark, check them out! And don't forget to subscribe and ring the bell for updates!",
+        "There are more great stories on your screen—click and enjoy! Subscribe and turn on notifications so you never miss out!",
+        "Ready for more? Two more stories are waiting. Subscribe and hit the bell so you never miss a tale!"
+    ],
+}
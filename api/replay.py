@@ -0,0 +1,286 @@
+"""Record model calls to a local archive and replay them without the API.
+
+In record mode every call made through the client is appended to the
+archive: the request key, the response text with the arrival time and size
+of each streamed chunk, token usage and, for failed calls, the error status.
+In replay mode a stand-in client serves those calls back, either with the
+recorded latency and chunk timing or as fast as possible. The dispatcher,
+retries, parsing and everything above them run unchanged.
+
+The archive is gzip-compressed JSON lines, one gzip member per call, so
+several workers can append to it and a crash loses at most the last call.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from .cache import ResponseCache
+from .usage import USAGE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMissError(LookupError):
+    """No recorded call matches a request made in replay mode."""
+
+
+def request_key(kwargs: dict) -> str:
+    """The inputs that determine a completion, hashed the same way as response cache keys."""
+    return ResponseCache.make_key(kwargs["model"], kwargs.get("system"), kwargs["messages"], kwargs["temperature"], kwargs["max_tokens"])
+
+
+def _preview(kwargs: dict, length: int = 120) -> str:
+    content = kwargs["messages"][-1]["content"]
+    if not isinstance(content, str):
+        content = " ".join(block.get("text", "") for block in content)
+    return " ".join(content.split())[:length]
+
+
+def _message(record: dict):
+    """A Messages API response object carrying what the service reads from one."""
+    usage = record.get("usage", {})
+    return SimpleNamespace(
+        model=record["model"],
+        content=[SimpleNamespace(type="text", text=record["text"])],
+        stop_reason=record.get("stop_reason"),
+        usage=SimpleNamespace(**{field: usage.get(field, 0) for field in USAGE_FIELDS})
+    )
+
+
+def _usage(usage) -> dict:
+    # Zero counters are left out to keep the archive small
+    return {field: value for field in USAGE_FIELDS if (value := getattr(usage, field, None))}
+
+
+class ModelCallArchive:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> list[dict]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        return records
+
+    async def append(self, record: dict):
+        data = gzip.compress((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data: bytes):
+        # A single O_APPEND write per call, so records from several workers do not interleave
+        with self._lock, open(self.path, "ab") as f:
+            f.write(data)
+
+
+class _RecordingStream:
+    """Wraps an SDK message stream, timing each text chunk as it passes through."""
+
+    def __init__(self, manager, on_done):
+        self._manager = manager
+        self._on_done = on_done
+        self._started = None
+        self._chunks = []
+        self._stream = None
+
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        try:
+            self._stream = await self._manager.__aenter__()
+        except Exception as e:
+            await self._on_done(None, self._started, None, e)
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._manager.__aexit__(*exc_info)
+
+    @property
+    def text_stream(self):
+        return self._text_stream()
+
+    async def _text_stream(self):
+        async for text in self._stream.text_stream:
+            self._chunks.append([round((time.perf_counter() - self._started) * 1000, 1), len(text)])
+            yield text
+
+    async def get_final_message(self):
+        message = await self._stream.get_final_message()
+        await self._on_done(message, self._started, self._chunks, None)
+        return message
+
+
+class _RecordingMessages:
+    def __init__(self, messages, archive: ModelCallArchive):
+        self._messages = messages
+        self._archive = archive
+
+    async def create(self, **kwargs):
+        started = time.perf_counter()
+        try:
+            message = await self._messages.create(**kwargs)
+        except Exception as e:
+            await self._record(kwargs, None, started, None, e)
+            raise
+        await self._record(kwargs, message, started, None, None)
+        return message
+
+    def stream(self, **kwargs):
+        return _RecordingStream(self._messages.stream(**kwargs), lambda *result: self._record(kwargs, *result))
+
+    async def _record(self, kwargs: dict, message, started: float, chunks, error):
+        record = {
+            "key": request_key(kwargs),
+            "model": kwargs["model"],
+            "max_tokens": kwargs["max_tokens"],
+            "prompt": _preview(kwargs),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if error is not None:
+            status = getattr(error, "status_code", None)
+            if status is None:
+                # Connection failures and timeouts depend on the network, not on the request
+                return
+            response = getattr(error, "response", None)
+            record["error"] = {"status": status, "message": str(error), "retry_after": response.headers.get("retry-after") if response is not None else None}
+        else:
+            record.update(
+                model=getattr(message, "model", None) or kwargs["model"],
+                text="".join(block.text for block in message.content if getattr(block, "type", "text") == "text"),
+                stop_reason=getattr(message, "stop_reason", None),
+                usage=_usage(message.usage)
+            )
+            if chunks:
+                record["chunks"] = chunks
+        await self._archive.append(record)
+
+
+class RecordingClient:
+    """Delegates to a real AsyncAnthropic client and appends every call to an archive."""
+
+    def __init__(self, client, archive: ModelCallArchive):
+        self._client = client
+        self.messages = _RecordingMessages(client.messages, archive)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _ReplayStream:
+    def __init__(self, record: dict, timing: bool):
+        self._record = record
+        self._timing = timing
+        self._started = None
+
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        if "error" in self._record:
+            await self._wait_until(self._record["duration_ms"])
+            raise _replay_error(self._record)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        return self._text_stream()
+
+    async def _text_stream(self):
+        text = self._record["text"]
+        # Calls recorded without streaming are replayed as one chunk arriving at the end
+        chunks = self._record.get("chunks") or [[self._record["duration_ms"], len(text)]]
+        offset = 0
+        for at_ms, length in chunks:
+            await self._wait_until(at_ms)
+            yield text[offset:offset + length]
+            offset += length
+        if offset < len(text):
+            yield text[offset:]
+
+    async def get_final_message(self):
+        await self._wait_until(self._record["duration_ms"])
+        return _message(self._record)
+
+    async def _wait_until(self, at_ms: float):
+        if self._timing:
+            delay = at_ms / 1000 - (time.perf_counter() - self._started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # Still yield to the loop so concurrency behaves like a real call
+            await asyncio.sleep(0)
+
+
+def _replay_error(record: dict):
+    import anthropic
+    import httpx
+
+    error = record["error"]
+    headers = {"retry-after": error["retry_after"]} if error.get("retry_after") else {}
+    response = httpx.Response(error["status"], headers=headers, request=httpx.Request("POST", "https://replay.invalid/v1/messages"))
+    if error["status"] == 429:
+        cls = anthropic.RateLimitError
+    elif error["status"] >= 500:
+        cls = anthropic.InternalServerError
+    else:
+        cls = anthropic.APIStatusError
+    return cls(error["message"], response=response, body=None)
+
+
+class _ReplayMessages:
+    def __init__(self, records: list[dict], timing: bool, strict: bool):
+        self._timing = timing
+        self._strict = strict
+        self._by_key = {}
+        self._by_max_tokens = {}
+        for record in records:
+            self._by_key.setdefault(record["key"], []).append(record)
+            if "error" not in record:
+                self._by_max_tokens.setdefault(record["max_tokens"], []).append(record)
+        self._served = {}
+
+    def _next(self, kwargs: dict) -> dict:
+        """Recorded calls with the same key are served in recorded order, cycling when exhausted."""
+        key = request_key(kwargs)
+        candidates = self._by_key.get(key)
+        if candidates is None and not self._strict:
+            # Changed prompts: take recorded calls of the same size in order
+            key = f"max_tokens:{kwargs['max_tokens']}"
+            candidates = self._by_max_tokens.get(kwargs["max_tokens"])
+        if not candidates:
+            raise ReplayMissError(f"No recorded model call for {kwargs['model']} prompt {_preview(kwargs)!r}")
+        index = self._served.get(key, 0)
+        self._served[key] = index + 1
+        return candidates[index % len(candidates)]
+
+    async def create(self, **kwargs):
+        stream = _ReplayStream(self._next(kwargs), self._timing)
+        await stream.__aenter__()
+        return await stream.get_final_message()
+
+    def stream(self, **kwargs):
+        return _ReplayStream(self._next(kwargs), self._timing)
+
+
+class ReplayClient:
+    """Stands in for AsyncAnthropic, serving the calls of a recorded archive."""
+
+    base_url = None
+
+    def __init__(self, archive: ModelCallArchive, timing: str = "recorded", strict: bool = True):
+        records = archive.load()
+        self.messages = _ReplayMessages(records, timing == "recorded", strict)
+        logger.info(f"Replaying {len(records)} recorded model calls from {archive.path} ({timing} timing)")
+
+    async def close(self):
+        pass
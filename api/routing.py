@@ -0,0 +1,61 @@
+from typing import Optional
+
+
+def _resolve(name: str, aliases: dict) -> str:
+    name = name.strip()
+    return aliases.get(name, name)
+
+
+def parse_routes(spec: str, aliases: dict = None) -> list[tuple]:
+    """Parse comma-separated ``task[<=words]:model`` rules into ``(task, max_words, model)`` tuples.
+
+    ``aliases`` maps short names such as "fast" to model ids.
+    """
+    aliases = aliases or {}
+    routes = []
+    for rule in filter(None, (rule.strip() for rule in (spec or "").split(","))):
+        target, _, model = rule.partition(":")
+        if not model:
+            raise ValueError(f"Invalid model route {rule!r}, expected task[<=words]:model")
+        task, _, max_words = target.partition("<=")
+        routes.append((task.strip(), int(max_words) if max_words else None, _resolve(model, aliases)))
+    return routes
+
+
+def parse_fallbacks(spec: str, aliases: dict = None) -> dict:
+    """Parse comma-separated ``model:fallback`` pairs into a dict."""
+    aliases = aliases or {}
+    fallbacks = {}
+    for pair in filter(None, (pair.strip() for pair in (spec or "").split(","))):
+        model, _, fallback = pair.partition(":")
+        if not fallback:
+            raise ValueError(f"Invalid model fallback {pair!r}, expected model:fallback")
+        fallbacks[_resolve(model, aliases)] = _resolve(fallback, aliases)
+    return fallbacks
+
+
+class ModelRouter:
+    """Picks the model for each call from its task and size.
+
+    Routes are checked in order and the first one whose task matches, and
+    whose word limit (if any) covers the call, wins; anything else goes to
+    the default model. ``fallback`` names the model to use when one is
+    overloaded.
+    """
+
+    def __init__(self, default_model: str, routes: list = None, fallbacks: dict = None):
+        self.default_model = default_model
+        self.routes = list(routes or [])
+        self.fallbacks = dict(fallbacks or {})
+
+    def route(self, task: str, words: int = None) -> str:
+        for route_task, max_words, model in self.routes:
+            if route_task != task:
+                continue
+            if max_words is None or (words is not None and words <= max_words):
+                return model
+        return self.default_model
+
+    def fallback(self, model: str) -> Optional[str]:
+        fallback = self.fallbacks.get(model)
+        return fallback if fallback != model else None
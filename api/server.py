@@ -0,0 +1,63 @@
+"""Production entry point: serve the API with several uvicorn worker processes.
+
+    python -m api.server
+
+Host, port, worker count, keep-alive and the shutdown grace period come from
+api/config.py. On SIGTERM the server stops accepting connections, lets
+in-flight requests (including streams) finish for up to SHUTDOWN_DRAIN_SECONDS,
+then drains running background jobs for the same period; jobs that are still
+running are released and resume from their last checkpoint elsewhere.
+
+Set SHARED_STATE_BACKEND=sqlite so the workers share one rate-limit budget and
+one response cache. Gunicorn can be used instead with the same settings:
+
+    gunicorn -c api/gunicorn_conf.py api.main:app
+"""
+import logging
+import os
+import tempfile
+
+import uvicorn
+
+from .config import (
+    API_HOST,
+    API_PORT,
+    API_WORKERS,
+    API_KEEPALIVE_SECONDS,
+    DEBUG,
+    SHARED_STATE_BACKEND,
+    SHUTDOWN_DRAIN_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_workers(workers: int):
+    """Environment needed before worker processes start."""
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Lets /metrics on any worker report the counters of all of them
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+    if workers > 1 and SHARED_STATE_BACKEND == "memory":
+        logger.warning(
+            f"Running {workers} workers with SHARED_STATE_BACKEND=memory: each worker "
+            "enforces its own rate limits and keeps its own response cache"
+        )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    prepare_workers(API_WORKERS)
+    uvicorn.run(
+        "api.main:app",
+        host=API_HOST,
+        port=API_PORT,
+        workers=API_WORKERS,
+        timeout_keep_alive=API_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS,
+        log_level="debug" if DEBUG else "info",
+        proxy_headers=True
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,202 +1,472 @@
-import anthropic
-import json
+import asyncio
 from fastapi import HTTPException
-from .prompts import generate_paragraph_prompt
-from dotenv import load_dotenv
-import os
+from .parsing import ParagraphStreamParser
+from .templates import load_templates
+from .forbidden import ForbiddenWordMatcher, compile_forbidden_words_async
+from .cache import ResponseCache
+from .state import SQLiteStateBackend, create_state_backend
+from .usage import usage_from_response, record_usage, record_cached_response, track_usage
+from .continuation import ContinuationPlanner
+from . import clients
+from .dispatcher import ModelDispatcher
+from .routing import ModelRouter, parse_routes, parse_fallbacks
+from .hedging import HedgePolicy
+from .metrics import (
+    observe_model_call,
+    observe_first_token,
+    observe_part,
+    observe_continuation_rounds,
+    count_parse_fallback,
+    count_cache_lookup,
+    count_forbidden_repair,
+)
+from .config import (
+    ANTHROPIC_SCRIPT_TIMEOUT,
+    ANTHROPIC_SEGMENT_TIMEOUT,
+    PARALLEL_PART_CONCURRENCY,
+    FORBIDDEN_WORDS_ENFORCED,
+    FORBIDDEN_REPAIR_MAX_ATTEMPTS,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_DB_PATH,
+    RESPONSE_CACHE_MAX_DISK_ENTRIES,
+    SHARED_STATE_BACKEND,
+    SHARED_STATE_DB_PATH,
+    PROMPT_CACHE_ENABLED,
+    PROMPT_CACHE_BETA_HEADER,
+    CONTINUATION_MAX_ROUNDS,
+    CONTINUATION_TOKEN_BUDGET,
+    GENERATION_DEADLINE_SECONDS,
+    MODEL_MAX_CONCURRENCY,
+    MODEL_REQUESTS_PER_MINUTE,
+    MODEL_TOKENS_PER_MINUTE,
+    MODEL_MAX_RETRIES,
+    MODEL_RETRY_BASE_DELAY,
+    MODEL_RETRY_MAX_DELAY,
+    BATCH_REGENERATE_CONCURRENCY,
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_DEFAULT_DELAY_SECONDS,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_BUDGET_RATIO,
+    HEDGE_MAX_WORDS,
+    MODEL_DEFAULT,
+    MODEL_FAST,
+    MODEL_ROUTES,
+    MODEL_FALLBACKS,
+    PROMPT_TEMPLATES_PATH,
+    PROMPT_CHANNEL,
+)
 import logging
 import math
-import random
-import re
+import time
 
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get API key with better error handling
-api_key = os.getenv("ANTHROPIC_API_KEY")
-if not api_key:
-    logger.error("ANTHROPIC_API_KEY environment variable is not set")
-    raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
+def _past(deadline: float) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
 
-try:
-    client = anthropic.Anthropic(api_key=api_key)
-    logger.info("Successfully initialized Anthropic client")
-except Exception as e:
-    logger.error(f"Failed to initialize Anthropic client: {str(e)}")
-    raise ValueError(f"Failed to initialize Anthropic client: {str(e)}")
+# Ends the paragraphs a stream reader task puts on its queue
+_STREAM_END = object()
 
 # Model output limit (safe for Claude 3 Haiku)
 MAX_WORDS_PER_REQUEST = 3500  # Adjust as needed for your model
 
-# CTA templates for paraphrasing
-CTA_INTRO = [
-    "Before we jump back in, let us know where you're watching from, and if this story resonates, hit subscribe—tomorrow, something special awaits!",
-    "Pause for a moment—comment your location and subscribe if this story moves you. Tomorrow, we've got a treat lined up!",
-    "Share where you're tuning in from, and if this story speaks to you, subscribe for more—tomorrow brings something unique!"
-]
-CTA_1500 = [
-    "Crafting and narrating this tale took time—if you're enjoying it, please subscribe. Your support means the world! Now, back to the story.",
-    "If you're finding this story engaging, consider subscribing to our channel. It helps us a lot! Let's continue.",
-    "Enjoying the journey so far? Subscribe to support us, and let's dive back in!"
-]
-CTA_6000 = [
-    "Still with us? Don't forget to subscribe for more stories like this!",
-    "If you're enjoying the video so far, hit that subscribe button!",
-    "Liking the story? Make sure to subscribe so you never miss an update!"
-]
-CTA_END = [
-    "Up next, two more standout stories await. If this one hit the mark, check them out! And don't forget to subscribe and ring the bell for updates!",
-    "There are more great stories on your screen—click and enjoy! Subscribe and turn on notifications so you never miss out!",
-    "Ready for more? Two more stories are waiting. Subscribe and hit the bell so you never miss a tale!"
-]
-
-def get_paraphrased_cta(cta_list):
-    return random.choice(cta_list)
-
 class AnthropicService:
     def __init__(self):
-        self.model = "claude-3-5-sonnet-20240620"
-        self.system_prompt = "You are an expert script writer who creates engaging, well-structured video scripts."
-    
+        self.router = ModelRouter(
+            MODEL_DEFAULT,
+            parse_routes(MODEL_ROUTES, {"default": MODEL_DEFAULT, "fast": MODEL_FAST}),
+            parse_fallbacks(MODEL_FALLBACKS, {"default": MODEL_DEFAULT, "fast": MODEL_FAST})
+        )
+        self.templates = load_templates(PROMPT_TEMPLATES_PATH, PROMPT_CHANNEL)
+        self.state = create_state_backend(SHARED_STATE_BACKEND, SHARED_STATE_DB_PATH, RESPONSE_CACHE_MAX_DISK_ENTRIES)
+        self.cache = None
+        if RESPONSE_CACHE_ENABLED:
+            if RESPONSE_CACHE_DB_PATH:
+                cache_store = SQLiteStateBackend(RESPONSE_CACHE_DB_PATH, max_cache_entries=RESPONSE_CACHE_MAX_DISK_ENTRIES)
+            else:
+                cache_store = self.state if self.state.shared else None
+            self.cache = ResponseCache(
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                store=cache_store
+            )
+        self.dispatcher = ModelDispatcher(
+            clients.get_client,
+            max_concurrency=MODEL_MAX_CONCURRENCY,
+            requests_per_minute=MODEL_REQUESTS_PER_MINUTE,
+            tokens_per_minute=MODEL_TOKENS_PER_MINUTE,
+            max_retries=MODEL_MAX_RETRIES,
+            base_delay=MODEL_RETRY_BASE_DELAY,
+            max_delay=MODEL_RETRY_MAX_DELAY,
+            state=self.state,
+            fallback=self.router.fallback,
+            hedge=HedgePolicy(
+                percentile=HEDGE_PERCENTILE,
+                default_delay=HEDGE_DEFAULT_DELAY_SECONDS,
+                min_delay=HEDGE_MIN_DELAY_SECONDS,
+                budget_ratio=HEDGE_BUDGET_RATIO
+            ) if HEDGE_ENABLED else None
+        )
+
+    def _system_blocks(self, prefix: str) -> list:
+        """System prompt followed by the stable per-script prefix, marked for prompt caching."""
+        prefix_block = {"type": "text", "text": prefix}
+        if PROMPT_CACHE_ENABLED:
+            prefix_block["cache_control"] = {"type": "ephemeral"}
+        return [{"type": "text", "text": self.templates.system}, prefix_block]
+
+    def _build_request(self, prompt: str, system=None, max_tokens: int = 4000, temperature: float = 0.7, timeout: float = ANTHROPIC_SCRIPT_TIMEOUT, model: str = None) -> dict:
+        kwargs = {
+            "model": model or self.router.default_model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "timeout": timeout
+        }
+        if system:
+            kwargs["system"] = system
+        if PROMPT_CACHE_ENABLED and PROMPT_CACHE_BETA_HEADER:
+            kwargs["extra_headers"] = {"anthropic-beta": PROMPT_CACHE_BETA_HEADER}
+        return kwargs
+
+    def _record_usage(self, response_usage) -> dict:
+        call_usage = usage_from_response(response_usage)
+        record_usage(call_usage)
+        logger.debug(
+            "Model usage: input=%d cache_read=%d cache_write=%d output=%d",
+            call_usage["input_tokens"],
+            call_usage["cache_read_input_tokens"],
+            call_usage["cache_creation_input_tokens"],
+            call_usage["output_tokens"]
+        )
+        return call_usage
+
+    async def _cached(self, cache_key: str, use_cache: bool):
+        if self.cache is None or not use_cache:
+            return None
+        cached = await self.cache.get(cache_key)
+        count_cache_lookup(cached is not None)
+        if cached is not None:
+            record_cached_response()
+        return cached
+
+    def _cache_key(self, kwargs: dict) -> str:
+        return ResponseCache.make_key(
+            kwargs["model"],
+            kwargs.get("system"),
+            kwargs["messages"],
+            kwargs["temperature"],
+            kwargs["max_tokens"],
+            version=self.templates.version
+        )
 
-    async def continue_script(self, title: str, transcript: str, forbidden_words: list[str], structure_prompt: str, current_story: list, remaining_words: int):
+    async def _create_message(self, prompt: str, system=None, max_tokens: int = 4000, temperature: float = 0.7, timeout: float = ANTHROPIC_SCRIPT_TIMEOUT, use_cache: bool = True, task: str = "script", hedge: bool = False, words: int = None) -> str:
+        """Send a single prompt through the shared async client and return the stripped text.
+
+        The model is routed by ``task`` and the requested ``words``. Short
+        calls on the user's critical path pass ``hedge=True`` so a slow
+        upstream response can be raced by a second call.
+        """
+        kwargs = self._build_request(prompt, system, max_tokens, temperature, timeout, self.router.route(task, words))
+        cache_key = self._cache_key(kwargs)
+        cached = await self._cached(cache_key, use_cache)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
         try:
-            forbidden_words_str = ", ".join(forbidden_words) if isinstance(forbidden_words, list) else str(forbidden_words)
-            context = "\n".join(current_story[-5:]) if len(current_story) >= 5 else "\n".join(current_story)
-            part_word_count = min(MAX_WORDS_PER_REQUEST, remaining_words)
-            prompt = f"""
-You are a professional, versatile scriptwriter for YouTube videos. Continue the following story, making sure to add new content and not repeat or summarize previous parts. Do not end the story until the word count is met.
-
-Title: {title}
-Target Word Count for this part: {part_word_count}
-Forbidden Words: {forbidden_words_str if forbidden_words else 'None'}
-Inspirational Transcript: {transcript}
-
-{f'Follow this structure: {structure_prompt}' if structure_prompt else ''}
-
-Continue the story from the following context:
-{context}
-
-**Script Requirements:**
-- Continue the story, do not repeat or summarize previous content.
-- The script MUST be as close as possible to {part_word_count} words for this part. Do NOT generate fewer words. Do NOT exceed the word count by more than 5%.
-- The script should be divided into paragraphs, each as a string in a JSON array.
-- The script should be original, not copying the transcript, but using it for pacing, style, and structure.
-- The script should be suitable for narration and keep viewers engaged.
-- Do NOT include any text before or after the JSON array. Return ONLY a valid JSON array of strings, where each string is a paragraph.
-
-**Example Output:**
-["Paragraph 1...", "Paragraph 2...", ...]
-"""
-            response = client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                temperature=0.7,
-                system=self.system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            script_text = response.content[0].text.strip()
+            # Identical prompts already in flight share one upstream call unless the cache is bypassed
+            response, shared = await self.dispatcher.create(kwargs, coalesce_key=cache_key if use_cache else None, hedge_task=task if hedge else None)
+        except Exception:
+            observe_model_call(task, kwargs["model"], time.perf_counter() - started, "error")
+            raise
+        model = self._served_model(response, kwargs, task)
+        if shared:
+            record_cached_response()
+            observe_model_call(task, model, time.perf_counter() - started, "coalesced")
+            return response.content[0].text.strip()
+        call_usage = self._record_usage(response.usage)
+        observe_model_call(task, model, time.perf_counter() - started, "ok", call_usage)
+        text = response.content[0].text.strip()
+        if self.cache is not None and text:
+            # Bypassed requests still refresh the cache with the new completion
+            await self.cache.set(cache_key, text)
+        return text
+
+    async def _stream_paragraphs(self, prompt: str, system=None, max_tokens: int = 4000, temperature: float = 0.7, timeout: float = ANTHROPIC_SCRIPT_TIMEOUT, use_cache: bool = True, task: str = "script", words: int = None):
+        """Stream a prompt and yield each paragraph of the JSON array as soon as it is complete."""
+        kwargs = self._build_request(prompt, system, max_tokens, temperature, timeout, self.router.route(task, words))
+        parser = ParagraphStreamParser()
+        cache_key = self._cache_key(kwargs)
+        cached = await self._cached(cache_key, use_cache)
+        if cached is not None:
+            for paragraph in parser.feed(cached):
+                yield paragraph
+        else:
+            # The upstream stream is read by its own task, so the dispatcher slot it holds
+            # is released as soon as the model is done, however long the caller takes with
+            # each paragraph (a slow client, or a repair call that needs a slot of its own)
+            queue = asyncio.Queue()
+            reader = asyncio.ensure_future(self._read_stream(kwargs, parser, cache_key, task, queue))
             try:
-                paragraphs = json.loads(script_text)
-                if not isinstance(paragraphs, list):
-                    paragraphs = [script_text]
-            except Exception as e:
-                logging.warning(f"Failed to parse JSON: {e}. Returning plain text.")
-                paragraphs = [script_text]
+                while (paragraph := await queue.get()) is not _STREAM_END:
+                    yield paragraph
+                await reader
+            finally:
+                if not reader.done():
+                    reader.cancel()
+                    await asyncio.gather(reader, return_exceptions=True)
+        paragraphs = parser.close()
+        if parser.fallback:
+            logging.warning("Model output contained no JSON; split it on blank lines.")
+            count_parse_fallback(task)
+        for paragraph in paragraphs:
+            yield paragraph
+
+    async def _read_stream(self, kwargs: dict, parser: ParagraphStreamParser, cache_key: str, task: str, queue: asyncio.Queue):
+        """Stream a request into ``queue`` paragraph by paragraph, ending with _STREAM_END even on failure."""
+        chunks = []
+        started = time.perf_counter()
+        outcome = "error"
+        call_usage = None
+        model = kwargs["model"]
+        try:
+            async with self.dispatcher.stream(kwargs) as stream:
+                async for text in stream.text_stream:
+                    if not chunks:
+                        observe_first_token(task, kwargs["model"], time.perf_counter() - started)
+                    chunks.append(text)
+                    for paragraph in parser.feed(text):
+                        queue.put_nowait(paragraph)
+                final_message = await stream.get_final_message()
+            model = self._served_model(final_message, kwargs, task)
+            call_usage = self._record_usage(final_message.usage)
+            outcome = "ok"
+        finally:
+            observe_model_call(task, model, time.perf_counter() - started, outcome, call_usage)
+            queue.put_nowait(_STREAM_END)
+        text = "".join(chunks).strip()
+        if self.cache is not None and text:
+            await self.cache.set(cache_key, text)
+
+    @staticmethod
+    def _served_model(response, kwargs: dict, task: str) -> str:
+        """Log and return the model that answered, which differs from the routed one after a fallback."""
+        model = getattr(response, "model", None) or kwargs["model"]
+        logger.info(f"{task} call served by {model}")
+        return model
+
+    async def close(self):
+        """Release the pooled HTTP connections and the state backends."""
+        await clients.close()
+        if self.cache is not None and self.cache.store not in (None, self.state):
+            self.cache.store.close()
+        self.state.close()
+
+    def _plan_parts(self, word_count: int, seed: str = None) -> list[dict]:
+        """Split the target word count into parts and pick the CTA for each one."""
+        num_parts = math.ceil(word_count / MAX_WORDS_PER_REQUEST)
+        words_per_part = math.ceil(word_count / num_parts)
+        parts = []
+        for part in range(num_parts):
+            part_start = part * words_per_part
+            part_end = min((part + 1) * words_per_part, word_count)
+            parts.append({
+                "index": part,
+                "start": part_start,
+                "word_count": part_end - part_start,
+                "cta": self.templates.ctas.for_part(part, part_start, seed=seed)
+            })
+        return parts
+
+    @staticmethod
+    def _part_task(part: dict) -> str:
+        """Task name (for routing and metrics) of a planned part; the first one is the opening."""
+        return "opening" if part["index"] == 0 else "part"
+
+    @staticmethod
+    def _parse_output(text: str, task: str = "script") -> tuple[list[str], ParagraphStreamParser]:
+        """Parse a complete model output, returning its paragraphs and the parser (for fields and fallback)."""
+        parser = ParagraphStreamParser()
+        paragraphs = parser.parse(text)
+        if parser.fallback:
+            logging.warning("Model output contained no JSON; split it on blank lines.")
+            count_parse_fallback(task)
+        return paragraphs, parser
+
+    @classmethod
+    def _parse_paragraphs(cls, script_text: str, task: str = "script") -> list[str]:
+        return cls._parse_output(script_text, task)[0]
+
+    @staticmethod
+    async def _forbidden_matcher(forbidden_words) -> ForbiddenWordMatcher:
+        """Compiled matcher for the request's forbidden words, or None when there is nothing to enforce."""
+        if not FORBIDDEN_WORDS_ENFORCED:
+            return None
+        matcher = await compile_forbidden_words_async(forbidden_words)
+        return matcher if matcher else None
+
+    async def _repair_paragraph(self, paragraph: str, matcher: ForbiddenWordMatcher, use_cache: bool = True, task: str = "script") -> str:
+        """Rewrite a paragraph that uses forbidden words with a small targeted call; clean paragraphs are returned as is."""
+        violations = matcher.find(paragraph)
+        if not violations:
+            return paragraph
+        best = paragraph
+        for attempt in range(FORBIDDEN_REPAIR_MAX_ATTEMPTS):
+            text = await self._create_message(
+                self.templates.repair(best, violations),
+                max_tokens=max(500, len(best.split()) * 3),
+                timeout=ANTHROPIC_SEGMENT_TIMEOUT,
+                # A retry with the same prompt must not be answered from the cache
+                use_cache=use_cache and attempt == 0,
+                task="repair",
+                words=len(best.split())
+            )
+            paragraphs, parser = self._parse_output(text, task="repair")
+            if parser.fallback or not paragraphs:
+                continue
+            candidate = "\n\n".join(paragraphs)
+            remaining = matcher.find(candidate)
+            if len(remaining) <= len(violations):
+                best, violations = candidate, remaining
+            if not violations:
+                break
+        count_forbidden_repair(task, not violations)
+        if violations:
+            logging.warning(f"Paragraph still contains forbidden words after repair: {', '.join(violations)}")
+        return best
+
+    async def _enforce_forbidden_words(self, paragraphs: list[str], forbidden_words, use_cache: bool = True, task: str = "script") -> list[str]:
+        """Scan generated paragraphs and repair only the ones that use forbidden words."""
+        matcher = await self._forbidden_matcher(forbidden_words)
+        if matcher is None:
+            return paragraphs
+        offending = [index for index, paragraph in enumerate(paragraphs) if matcher.find(paragraph)]
+        if not offending:
+            return paragraphs
+        semaphore = asyncio.Semaphore(PARALLEL_PART_CONCURRENCY)
+
+        async def repair(index: int) -> str:
+            async with semaphore:
+                return await self._repair_paragraph(paragraphs[index], matcher, use_cache, task)
+
+        repaired = await asyncio.gather(*(repair(index) for index in offending))
+        paragraphs = list(paragraphs)
+        for index, paragraph in zip(offending, repaired):
+            paragraphs[index] = paragraph
+        return paragraphs
+
+    async def continue_script(self, title: str, transcript: str, forbidden_words: list[str], structure_prompt: str, current_story: list, remaining_words: int, use_cache: bool = True, max_tokens: int = 4000, part_word_count: int = None, current_total_words: int = None):
+        try:
+            context = "\n".join(current_story[-5:])
+            if part_word_count is None:
+                part_word_count = min(MAX_WORDS_PER_REQUEST, remaining_words)
+            # Callers that keep a running total pass it in to avoid recounting the story
+            if current_total_words is None:
+                current_total_words = len(" ".join(current_story).split())
+            system = self._system_blocks(self.templates.script_prefix(title, transcript, structure_prompt, forbidden_words))
+            prompt = self.templates.continuation(part_word_count, context)
+            script_text = await self._create_message(prompt, system=system, max_tokens=max_tokens, use_cache=use_cache, task="continuation", words=part_word_count)
+            paragraphs = self._parse_paragraphs(script_text, task="continuation")
+            paragraphs = await self._enforce_forbidden_words(paragraphs, forbidden_words, use_cache, task="continuation")
             updated_story = current_story + paragraphs
-            total_words = len(" ".join(updated_story).split())
-            completed = total_words >= (len(" ".join(current_story).split()) + remaining_words)
+            new_words = sum(len(paragraph.split()) for paragraph in paragraphs)
+            total_words = current_total_words + new_words
             next_context = "\n".join(updated_story[-5:])
             return {
                 "paragraphs": updated_story,
                 "total_words": total_words,
                 "context": next_context,
-                "remaining_words": max(0, (len(" ".join(current_story).split()) + remaining_words) - total_words),
-                "completed": completed
+                "remaining_words": max(0, remaining_words - new_words),
+                "completed": new_words >= remaining_words
             }
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Script continuation failed: {e}")
             raise HTTPException(status_code=500, detail=f"Script continuation failed: {str(e)}")
 
+    @staticmethod
+    def _new_planner(word_count: int) -> ContinuationPlanner:
+        return ContinuationPlanner(
+            target_words=word_count,
+            max_words_per_round=MAX_WORDS_PER_REQUEST,
+            max_rounds=CONTINUATION_MAX_ROUNDS,
+            token_budget=CONTINUATION_TOKEN_BUDGET,
+            deadline_seconds=GENERATION_DEADLINE_SECONDS
+        )
 
-    async def generate_script(self, title: str, word_count: int, forbidden_words: list[str], transcript: str = None, structure_prompt: str = ""):
+    async def generate_full_script(self, title: str, word_count: int, forbidden_words: list[str], transcript: str = None, structure_prompt: str = "", mode: str = "sequential", smooth_transitions: bool = False, use_cache: bool = True):
+        """Generate a script, then top it up with continuation rounds within the configured budgets.
+
+        The result carries "partial" and "stop_reason" when a round, token or
+        deadline budget ended the run before the target word count was reached.
+        """
+        planner = self._new_planner(word_count)
+        with track_usage() as usage:
+            result = await self.generate_script(title, word_count, forbidden_words, transcript, structure_prompt, mode=mode, smooth_transitions=smooth_transitions, use_cache=use_cache, deadline=planner.deadline)
+        planner.observe(result["total_words"], usage["output_tokens"])
+        while (round_plan := planner.next_round()) is not None:
+            words_before = planner.total_words
+            with track_usage() as usage:
+                result = await self.continue_script(
+                    title,
+                    transcript,
+                    forbidden_words,
+                    structure_prompt,
+                    result["paragraphs"],
+                    planner.remaining_words,
+                    use_cache=use_cache,
+                    max_tokens=round_plan["max_tokens"],
+                    part_word_count=round_plan["word_count"],
+                    current_total_words=words_before
+                )
+            planner.observe_round(result["total_words"] - words_before, usage["output_tokens"])
+        observe_continuation_rounds(planner.rounds)
+        if planner.partial:
+            logging.warning(f"Stopped continuation after {planner.rounds} rounds ({planner.stop_reason}) with {planner.remaining_words} words remaining")
+        result["total_words"] = planner.total_words
+        result["remaining_words"] = planner.remaining_words
+        result["completed"] = planner.remaining_words == 0
+        result["partial"] = planner.partial
+        result["stop_reason"] = planner.stop_reason
+        result["continuation_rounds"] = planner.rounds
+        return result
+
+    async def generate_script(self, title: str, word_count: int, forbidden_words: list[str], transcript: str = None, structure_prompt: str = "", mode: str = "sequential", smooth_transitions: bool = False, use_cache: bool = True, deadline: float = None):
+        """Write the planned parts; parts not started by ``deadline`` (time.monotonic()) are skipped."""
+        if mode == "outline":
+            return await self._generate_script_from_outline(title, word_count, forbidden_words, transcript, structure_prompt, smooth_transitions, use_cache, deadline)
         try:
-            forbidden_words_str = ", ".join(forbidden_words) if isinstance(forbidden_words, list) else str(forbidden_words)
-            num_parts = math.ceil(word_count / MAX_WORDS_PER_REQUEST)
-            words_per_part = math.ceil(word_count / num_parts)
             all_paragraphs = []
             total_words = 0
             context = ""
-            for part in range(num_parts):
-                part_start = part * words_per_part
-                part_end = min((part + 1) * words_per_part, word_count)
-                part_word_count = part_end - part_start
-                # Insert CTAs at the right points
-                cta = ""
-                if part == 0:
-                    cta = get_paraphrased_cta(CTA_INTRO)
-                elif part_start >= 1500 and part_start < 6000:
-                    cta = get_paraphrased_cta(CTA_1500)
-                elif part_start >= 6000:
-                    cta = get_paraphrased_cta(CTA_6000)
-                prompt = f"""
-You are a professional, versatile scriptwriter for YouTube videos. Your task is to write a compelling, original script based on the new video title.
-
-Title: {title}
-Target Word Count for this part: {part_word_count}
-Forbidden Words: {forbidden_words_str if forbidden_words else 'None'}
-{f'Inspirational Transcript: {transcript}' if transcript else ''}
-
-{f'Follow this structure: {structure_prompt}' if structure_prompt else ''}
-
-Continue the story from the following context (if any):
-{context}
-
-{f'Include this call to action at a natural point in this part: "{cta}"' if cta else ''}
-
-**Script Requirements:**
-- The script MUST be as close as possible to {part_word_count} words for this part. Do NOT generate fewer words. Do NOT exceed the word count by more than 5%.
-- The script should be divided into paragraphs, each as a string in a JSON array.
-- The script should be original and creative, using the title as inspiration.
-- The script should be suitable for narration and keep viewers engaged.
-- Do NOT include any text before or after the JSON array. Return ONLY a valid JSON array of strings, where each string is a paragraph.
-
-**Example Output:**
-["Paragraph 1...", "Paragraph 2...", ...]
-"""
-                response = client.messages.create(
-                    model=self.model,
-                    max_tokens=4000,
-                    temperature=0.7,
-                    system=self.system_prompt,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                )
-                script_text = response.content[0].text.strip()
-                try:
-                    paragraphs = json.loads(script_text)
-                    if not isinstance(paragraphs, list):
-                        paragraphs = [script_text]
-                except Exception as e:
-                    logging.warning(f"Failed to parse JSON: {e}. Returning plain text.")
-                    paragraphs = [script_text]
+            system = self._system_blocks(self.templates.script_prefix(title, transcript, structure_prompt, forbidden_words))
+            parts = self._plan_parts(word_count, seed=title)
+            for part in parts:
+                if _past(deadline):
+                    logging.warning(f"Generation deadline reached before part {part['index'] + 1} of {len(parts)}")
+                    break
+                part_started = time.perf_counter()
+                prompt = self.templates.part(part["word_count"], context, part["cta"])
+                task = self._part_task(part)
+                script_text = await self._create_message(prompt, system=system, use_cache=use_cache, task=task, hedge=part["word_count"] <= HEDGE_MAX_WORDS, words=part["word_count"])
+                paragraphs = self._parse_paragraphs(script_text, task=task)
+                paragraphs = await self._enforce_forbidden_words(paragraphs, forbidden_words, use_cache, task=task)
+                observe_part(part["index"], time.perf_counter() - part_started)
                 all_paragraphs.extend(paragraphs)
                 context = "\n".join(all_paragraphs[-5:])  # Provide last 5 paragraphs as context for next part
                 total_words = len(" ".join(all_paragraphs).split())
             # Add final CTA at the end
-            all_paragraphs.append(get_paraphrased_cta(CTA_END))
+            all_paragraphs.append(self.templates.ctas.closing(seed=title))
             total_words = len(" ".join(all_paragraphs).split())
             completed = total_words >= word_count
             # Prepare context for next chunk (last 5 paragraphs)
@@ -208,11 +478,206 @@ Continue the story from the following context (if any):
                 "remaining_words": max(0, word_count - total_words),
                 "completed": completed
             }
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Script generation failed: {e}")
             raise HTTPException(status_code=500, detail=f"Script generation failed: {str(e)}")
 
-    def regenerate_segment(
+    async def _smooth_transition(self, previous_paragraph: str, next_paragraph: str, system=None, use_cache: bool = True) -> str:
+        prompt = self.templates.transition(previous_paragraph, next_paragraph)
+        text = await self._create_message(prompt, system=system, max_tokens=1000, timeout=ANTHROPIC_SEGMENT_TIMEOUT, use_cache=use_cache, task="transition", words=len(next_paragraph.split()))
+        paragraphs, parser = self._parse_output(text, task="transition")
+        if parser.fallback or not paragraphs:
+            # Plain text here is more likely commentary than the rewritten paragraph
+            return next_paragraph
+        return "\n\n".join(paragraphs)
+
+    async def _generate_script_from_outline(self, title: str, word_count: int, forbidden_words: list[str], transcript: str = None, structure_prompt: str = "", smooth_transitions: bool = False, use_cache: bool = True, deadline: float = None):
+        """Plan the story as an outline, then write every part concurrently and stitch them in order.
+
+        Turns N sequential round-trips into an outline call plus one concurrent
+        round (and an optional round of small transition rewrites).
+        """
+        try:
+            parts = self._plan_parts(word_count, seed=title)
+            if len(parts) == 1:
+                return await self.generate_script(title, word_count, forbidden_words, transcript, structure_prompt, use_cache=use_cache, deadline=deadline)
+
+            system = self._system_blocks(self.templates.script_prefix(title, transcript, structure_prompt, forbidden_words))
+            outline_text = await self._create_message(
+                self.templates.outline(structure_prompt, len(parts), word_count),
+                system=system,
+                max_tokens=2000,
+                use_cache=use_cache,
+                task="outline"
+            )
+            outline = [str(item) for item in self._parse_paragraphs(outline_text, task="outline")]
+            if len(outline) < len(parts):
+                logging.warning(f"Outline returned {len(outline)} sections for {len(parts)} parts; falling back to sequential generation")
+                return await self.generate_script(title, word_count, forbidden_words, transcript, structure_prompt, use_cache=use_cache, deadline=deadline)
+            outline = outline[:len(parts)]
+
+            semaphore = asyncio.Semaphore(PARALLEL_PART_CONCURRENCY)
+
+            async def write_part(part: dict) -> list:
+                prompt = self.templates.outline_section(part["word_count"], outline, part["index"], part["cta"])
+                task = self._part_task(part)
+                async with semaphore:
+                    # Parts start in order, so those skipped at the deadline are the end of the story
+                    if _past(deadline):
+                        return []
+                    part_started = time.perf_counter()
+                    script_text = await self._create_message(prompt, system=system, use_cache=use_cache, task=task, hedge=part["word_count"] <= HEDGE_MAX_WORDS, words=part["word_count"])
+                    observe_part(part["index"], time.perf_counter() - part_started)
+                paragraphs = self._parse_paragraphs(script_text, task=task)
+                return await self._enforce_forbidden_words(paragraphs, forbidden_words, use_cache, task=task)
+
+            part_paragraphs = await asyncio.gather(*(write_part(part) for part in parts))
+
+            if smooth_transitions and not _past(deadline):
+                matcher = await self._forbidden_matcher(forbidden_words)
+
+                async def smooth(index: int):
+                    async with semaphore:
+                        # The project prefix tells the model the forbidden words; the rewrite is still checked
+                        paragraph = await self._smooth_transition(part_paragraphs[index - 1][-1], part_paragraphs[index][0], system, use_cache)
+                        if matcher is not None:
+                            paragraph = await self._repair_paragraph(paragraph, matcher, use_cache, task="transition")
+                        part_paragraphs[index][0] = paragraph
+
+                await asyncio.gather(*(
+                    smooth(index) for index in range(1, len(part_paragraphs))
+                    if part_paragraphs[index] and part_paragraphs[index - 1]
+                ))
+
+            all_paragraphs = [paragraph for paragraphs in part_paragraphs for paragraph in paragraphs]
+            # Add final CTA at the end
+            all_paragraphs.append(self.templates.ctas.closing(seed=title))
+            total_words = len(" ".join(all_paragraphs).split())
+            return {
+                "paragraphs": all_paragraphs,
+                "total_words": total_words,
+                "context": "\n".join(all_paragraphs[-5:]),
+                "remaining_words": max(0, word_count - total_words),
+                "completed": total_words >= word_count
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Outline script generation failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Script generation failed: {str(e)}")
+
+    async def generate_script_stream(self, title: str, word_count: int, forbidden_words: list[str], transcript: str = None, structure_prompt: str = "", use_cache: bool = True, paragraphs: list = None, start_part: int = 0, continuation: dict = None):
+        """Generate a script and yield progress events as paragraphs are produced.
+
+        Uses the same part plan and CTA placement as generate_script, followed by
+        continuation rounds until the target word count is reached. Events are
+        dicts with an "event" key: "start", "paragraph", "part_complete", "done"
+        or "error".
+
+        To resume an interrupted run, pass the paragraphs produced so far, the
+        number of parts (including continuation rounds) already completed and the
+        "continuation" state of the last "part_complete" event, so the round,
+        token and deadline budgets carry over instead of starting again.
+        """
+        # Started with the request, like generate_full_script, so the deadline covers the planned parts too
+        planner = self._new_planner(word_count)
+        if continuation:
+            planner.restore(continuation)
+        paragraphs = list(paragraphs or [])
+        total_words = sum(len(paragraph.split()) for paragraph in paragraphs)
+        restored_words = total_words
+        try:
+            parts = self._plan_parts(word_count, seed=title)
+            yield {"event": "start", "parts": len(parts), "target_words": word_count, "start_part": start_part}
+            context = "\n".join(paragraphs[-5:])
+            system = self._system_blocks(self.templates.script_prefix(title, transcript, structure_prompt, forbidden_words))
+            matcher = await self._forbidden_matcher(forbidden_words)
+            with track_usage() as usage:
+                for part in parts[start_part:]:
+                    if planner.expired():
+                        logging.warning(f"Generation deadline reached before part {part['index'] + 1} of {len(parts)}")
+                        break
+                    part_started = time.perf_counter()
+                    prompt = self.templates.part(part["word_count"], context, part["cta"])
+                    task = self._part_task(part)
+                    async for paragraph in self._stream_paragraphs(prompt, system=system, use_cache=use_cache, task=task, words=part["word_count"]):
+                        if matcher is not None:
+                            paragraph = await self._repair_paragraph(paragraph, matcher, use_cache, task=task)
+                        paragraphs.append(paragraph)
+                        total_words += len(paragraph.split())
+                        yield self._paragraph_event(part["index"], paragraphs, total_words, word_count)
+                    observe_part(part["index"], time.perf_counter() - part_started)
+                    context = "\n".join(paragraphs[-5:])
+                    yield self._part_complete_event(part["index"], total_words, word_count, planner)
+
+            # Add final CTA at the end (a checkpoint past the planned parts already includes it)
+            if start_part <= len(parts):
+                paragraphs.append(self.templates.ctas.closing(seed=title))
+                total_words += len(paragraphs[-1].split())
+                yield self._paragraph_event(len(parts) - 1, paragraphs, total_words, word_count)
+
+            # Continue the story within the round, token and deadline budgets; only the words
+            # written in this run go with this run's tokens when estimating the yield
+            planner.add_existing(restored_words)
+            planner.observe(total_words - restored_words, usage["output_tokens"])
+            part_index = max(len(parts), start_part)
+            while (round_plan := planner.next_round()) is not None:
+                context = "\n".join(paragraphs[-5:])
+                prompt = self.templates.continuation(round_plan["word_count"], context)
+                words_before = total_words
+                with track_usage() as usage:
+                    async for paragraph in self._stream_paragraphs(prompt, system=system, max_tokens=round_plan["max_tokens"], use_cache=use_cache, task="continuation", words=round_plan["word_count"]):
+                        if matcher is not None:
+                            paragraph = await self._repair_paragraph(paragraph, matcher, use_cache, task="continuation")
+                        paragraphs.append(paragraph)
+                        total_words += len(paragraph.split())
+                        yield self._paragraph_event(part_index, paragraphs, total_words, word_count)
+                planner.observe_round(total_words - words_before, usage["output_tokens"])
+                yield self._part_complete_event(part_index, total_words, word_count, planner)
+                part_index += 1
+            observe_continuation_rounds(planner.rounds)
+
+            yield {
+                "event": "done",
+                "paragraph_count": len(paragraphs),
+                "total_words": total_words,
+                "remaining_words": max(0, word_count - total_words),
+                "completed": total_words >= word_count,
+                "partial": planner.partial,
+                "stop_reason": planner.stop_reason,
+                "continuation_rounds": planner.rounds
+            }
+        except HTTPException as e:
+            logging.error(f"Streaming script generation failed: {e.detail}")
+            yield {"event": "error", "status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logging.error(f"Streaming script generation failed: {e}")
+            yield {"event": "error", "status_code": 500, "detail": f"Script generation failed: {str(e)}"}
+
+    @staticmethod
+    def _paragraph_event(part: int, paragraphs: list, total_words: int, word_count: int) -> dict:
+        return {
+            "event": "paragraph",
+            "part": part,
+            "index": len(paragraphs) - 1,
+            "text": paragraphs[-1],
+            "total_words": total_words,
+            "remaining_words": max(0, word_count - total_words)
+        }
+
+    @staticmethod
+    def _part_complete_event(part: int, total_words: int, word_count: int, planner: ContinuationPlanner) -> dict:
+        return {
+            "event": "part_complete",
+            "part": part,
+            "total_words": total_words,
+            "remaining_words": max(0, word_count - total_words),
+            "continuation": planner.state()
+        }
+
+    async def regenerate_segment(
         self,
         context_before: str,
         context_after: str,
@@ -220,73 +685,75 @@ Continue the story from the following context (if any):
         title: str,
         inspirational_transcript: str = None,
         forbidden_words: list[str] = None,
-        structure_prompt: str = ""
+        structure_prompt: str = "",
+        use_cache: bool = True
     ) -> dict:
         """Regenerate a segment of the script."""
-        prompt = f"""You are a professional scriptwriter. Your task is to regenerate a segment of a video script.
-
-Current script context before the segment:
-{context_before}
-
-Current script context after the segment:
-{context_after}
-
-Please generate a new segment that:
-1. Maintains narrative consistency with the surrounding context
-2. Has approximately {segment_word_count} words
-3. Follows the same style and tone as the rest of the script
-4. Creates smooth transitions with the paragraphs before and after
-5. Is optimized for spoken delivery
-
-{f'Inspirational Transcript: {inspirational_transcript}' if inspirational_transcript else ''}
-
-Return ONLY a valid JSON object with two fields:
-1. "content": The regenerated segment text
-2. "wordCount": The number of words in the segment
-
-Example format:
-{{"content": "The segment text goes here.", "wordCount": 500}}
-
-Make sure the JSON is strictly valid and not nested inside another object or surrounded by any commentary."""
-
-        response = client.messages.create(
-            model=self.model,
-            max_tokens=4000,
-            temperature=0.7,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+        # Shares the cached prefix with generate_script and continue_script for the same script
+        system = self._system_blocks(self.templates.script_prefix(title, inspirational_transcript, structure_prompt, forbidden_words))
+        prompt = self.templates.regenerate(context_before, context_after, segment_word_count)
+
+        response_text = await self._create_message(
+            prompt,
+            system=system,
+            timeout=ANTHROPIC_SEGMENT_TIMEOUT,
+            use_cache=use_cache,
+            task="regenerate",
+            hedge=segment_word_count <= HEDGE_MAX_WORDS,
+            words=segment_word_count
         )
 
+        paragraphs = self._parse_paragraphs(response_text, task="regenerate")
+        paragraphs = await self._enforce_forbidden_words(paragraphs, forbidden_words, use_cache, task="regenerate")
+        if not paragraphs:
+            raise HTTPException(status_code=502, detail="Model response contained no segment content")
+        content = "\n\n".join(paragraphs)
+        # Counted locally; the model's own wordCount is only an estimate
+        return {
+            "content": content,
+            "wordCount": len(content.split())
+        }
+
+    async def regenerate_segments(
+        self,
+        segments: list[dict],
+        title: str,
+        inspirational_transcript: str = None,
+        forbidden_words: list[str] = None,
+        structure_prompt: str = "",
+        use_cache: bool = True
+    ):
+        """Regenerate several segments concurrently, yielding each result as it finishes.
+
+        Results are dicts with the segment's "index" and either "content" and
+        "wordCount" or an "error"; one failing segment does not fail the batch.
+        """
+        semaphore = asyncio.Semaphore(BATCH_REGENERATE_CONCURRENCY)
+
+        async def run(index: int, segment: dict) -> dict:
+            async with semaphore:
+                try:
+                    result = await self.regenerate_segment(
+                        context_before=segment["context_before"],
+                        context_after=segment["context_after"],
+                        segment_word_count=segment["segment_word_count"],
+                        title=title,
+                        inspirational_transcript=inspirational_transcript,
+                        forbidden_words=forbidden_words,
+                        structure_prompt=structure_prompt,
+                        use_cache=use_cache
+                    )
+                except HTTPException as e:
+                    return {"index": index, "error": e.detail}
+                except Exception as e:
+                    logging.error(f"Segment {index} regeneration failed: {e}")
+                    return {"index": index, "error": str(e)}
+            return {"index": index, **result}
+
+        tasks = [asyncio.ensure_future(run(index, segment)) for index, segment in enumerate(segments)]
         try:
-            # Get the response text
-            response_text = response.content[0].text.strip()
-            
-            # Extract content and word count using regex
-            content_match = re.search(r'"content":\s*"([^"]*)"', response_text)
-            word_count_match = re.search(r'"wordCount":\s*(\d+)', response_text)
-            
-            if content_match and word_count_match:
-                content = content_match.group(1)
-                word_count = int(word_count_match.group(1))
-                
-                # Unescape any escaped characters in the content
-                content = content.replace('\\"', '"').replace('\\n', '\n').replace('\\t', '\t')
-                
-                return {
-                    "content": content,
-                    "wordCount": word_count
-                }
-            else:
-                # If we can't extract the fields, use the whole text as content
-                return {
-                    "content": response_text,
-                    "wordCount": len(response_text.split())
-                }
-                
-        except Exception as e:
-            logging.error(f"Failed to process model response: {str(e)}")
-            raise ValueError(f"Failed to process model response: {str(e)}")
\ No newline at end of file
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class SessionStore:
+    """SQLite-backed server-side scripts.
+
+    A session keeps the script settings (title, transcript, forbidden words,
+    structure) and its paragraphs, one row each with its word count. The
+    running total lives on the session row and is adjusted by the difference
+    on every edit, so nothing is ever recounted or re-sent by the client.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = 7 * 86400):
+        self.ttl_seconds = ttl_seconds
+        # Every worker process opens the same file; wait for the write lock instead of failing
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, title TEXT NOT NULL, transcript TEXT, "
+            "forbidden_words TEXT NOT NULL DEFAULT '[]', structure_prompt TEXT NOT NULL DEFAULT '', "
+            "word_count INTEGER NOT NULL, paragraph_count INTEGER NOT NULL DEFAULT 0, "
+            "total_words INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_paragraphs ("
+            "session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, "
+            "idx INTEGER NOT NULL, text TEXT NOT NULL, words INTEGER NOT NULL, "
+            "PRIMARY KEY (session_id, idx)) WITHOUT ROWID"
+        )
+
+    async def create(self, title: str, word_count: int, transcript: str = None, forbidden_words: list = None, structure_prompt: str = "", paragraphs: list = None) -> dict:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+
+        def create(db):
+            db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+            db.execute(
+                "INSERT INTO sessions (id, title, transcript, forbidden_words, structure_prompt, word_count, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, title, transcript, json.dumps(forbidden_words or []), structure_prompt or "", word_count, now, now)
+            )
+            self._append(db, session_id, 0, paragraphs or [], now)
+            return self._get(db, session_id)
+
+        return await self._transaction(create)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Session settings and totals, without the paragraphs."""
+        return await self._transaction(lambda db: self._get(db, session_id), write=False)
+
+    async def paragraphs(self, session_id: str, start: int = 0, end: int = None) -> list[dict]:
+        """Paragraphs with ``start <= index < end``, each as {"index", "text", "words"}."""
+        def query(db):
+            rows = db.execute(
+                "SELECT idx, text, words FROM session_paragraphs WHERE session_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (session_id, max(0, start), end if end is not None else 2 ** 62)
+            ).fetchall()
+            return [{"index": row[0], "text": row[1], "words": row[2]} for row in rows]
+
+        return await self._transaction(query, write=False)
+
+    async def append(self, session_id: str, paragraphs: list[str], expected_count: int = None) -> Optional[tuple[dict, int]]:
+        """Add paragraphs at the end; returns the updated session and the index of the first one added.
+
+        Returns None if the session does not exist. With ``expected_count``, the
+        append is refused with a 409 if paragraphs were added or removed since
+        the caller read the session.
+        """
+        def append(db):
+            session = self._get(db, session_id)
+            if session is None:
+                return None
+            start = session["paragraph_count"]
+            if expected_count is not None and start != expected_count:
+                raise HTTPException(status_code=409, detail="Session changed while its next part was written; retry")
+            self._append(db, session_id, start, paragraphs, time.time())
+            return self._get(db, session_id), start
+
+        return await self._transaction(append)
+
+    async def replace(self, session_id: str, index: int, text: str) -> Optional[dict]:
+        """Replace one paragraph; returns the updated session, or None if the paragraph does not exist."""
+        def replace(db):
+            row = db.execute(
+                "SELECT words FROM session_paragraphs WHERE session_id = ? AND idx = ?", (session_id, index)
+            ).fetchone()
+            if row is None:
+                return None
+            words = count_words(text)
+            db.execute(
+                "UPDATE session_paragraphs SET text = ?, words = ? WHERE session_id = ? AND idx = ?",
+                (text, words, session_id, index)
+            )
+            db.execute(
+                "UPDATE sessions SET total_words = total_words + ?, updated_at = ? WHERE id = ?",
+                (words - row[0], time.time(), session_id)
+            )
+            return self._get(db, session_id)
+
+        return await self._transaction(replace)
+
+    async def delete(self, session_id: str) -> bool:
+        return await self._transaction(
+            lambda db: db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+        )
+
+    @staticmethod
+    def _append(db, session_id: str, start: int, paragraphs: list[str], now: float):
+        rows = [(session_id, start + offset, text, count_words(text)) for offset, text in enumerate(paragraphs)]
+        db.executemany("INSERT INTO session_paragraphs (session_id, idx, text, words) VALUES (?, ?, ?, ?)", rows)
+        db.execute(
+            "UPDATE sessions SET paragraph_count = paragraph_count + ?, total_words = total_words + ?, updated_at = ? WHERE id = ?",
+            (len(rows), sum(row[3] for row in rows), now, session_id)
+        )
+
+    @staticmethod
+    def _get(db, session_id: str) -> Optional[dict]:
+        cursor = db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        session = dict(zip([column[0] for column in cursor.description], row))
+        session["forbidden_words"] = json.loads(session["forbidden_words"])
+        return session
+
+    async def _transaction(self, operation, write: bool = True):
+        return await asyncio.to_thread(self._transaction_sync, operation, write)
+
+    def _transaction_sync(self, operation, write: bool):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                result = operation(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+
+class ScriptSessions:
+    """Continue and regenerate session scripts using only the paragraphs each call needs."""
+
+    # Paragraphs of the script given to the model as context on either side of an edit
+    CONTINUE_CONTEXT = 5
+    REGENERATE_CONTEXT = 2
+
+    def __init__(self, service, store: SessionStore, max_words_per_request: int = 3500):
+        self.service = service
+        self.store = store
+        self.max_words_per_request = max_words_per_request
+        # One lock per session with a continue in progress; dropped once nobody holds it
+        self._continue_locks = weakref.WeakValueDictionary()
+
+    async def continue_script(self, session_id: str, word_count: int = None, use_cache: bool = True) -> Optional[dict]:
+        """Write the next part of the script; returns the updated session and the new paragraphs.
+
+        Continues of one session run one at a time in this process, each building
+        on the previous one's paragraphs; across processes the append is refused
+        if another continue got there first.
+        """
+        lock = self._continue_locks.get(session_id)
+        if lock is None:
+            lock = self._continue_locks[session_id] = asyncio.Lock()
+        async with lock:
+            return await self._continue_script(session_id, word_count, use_cache)
+
+    async def _continue_script(self, session_id: str, word_count: int = None, use_cache: bool = True) -> Optional[dict]:
+        session = await self.store.get(session_id)
+        if session is None:
+            return None
+        remaining_words = max(0, session["word_count"] - session["total_words"])
+        part_word_count = word_count or min(self.max_words_per_request, remaining_words)
+        if part_word_count <= 0:
+            raise HTTPException(status_code=409, detail="Script already reached its word count; pass word_count to extend it")
+        count = session["paragraph_count"]
+        tail = [paragraph["text"] for paragraph in await self.store.paragraphs(session_id, count - self.CONTINUE_CONTEXT, count)]
+        result = await self.service.continue_script(
+            session["title"],
+            session["transcript"],
+            session["forbidden_words"],
+            session["structure_prompt"],
+            tail,
+            max(remaining_words, part_word_count),
+            use_cache=use_cache,
+            part_word_count=part_word_count,
+            current_total_words=session["total_words"]
+        )
+        new_paragraphs = result["paragraphs"][len(tail):]
+        appended = await self.store.append(session_id, new_paragraphs, expected_count=count)
+        if appended is None:
+            return None
+        session, start = appended
+        return {"session": session, "paragraphs": await self.store.paragraphs(session_id, start, start + len(new_paragraphs))}
+
+    async def regenerate_paragraph(self, session_id: str, index: int, segment_word_count: int = None, use_cache: bool = True) -> Optional[dict]:
+        """Rewrite one paragraph in place; returns the updated session and the new paragraph."""
+        session = await self.store.get(session_id)
+        if session is None:
+            return None
+        window = await self.store.paragraphs(session_id, index - self.REGENERATE_CONTEXT, index + self.REGENERATE_CONTEXT + 1)
+        target = next((paragraph for paragraph in window if paragraph["index"] == index), None)
+        if target is None:
+            return None
+        result = await self.service.regenerate_segment(
+            context_before="\n".join(paragraph["text"] for paragraph in window if paragraph["index"] < index),
+            context_after="\n".join(paragraph["text"] for paragraph in window if paragraph["index"] > index),
+            segment_word_count=segment_word_count or target["words"],
+            title=session["title"],
+            inspirational_transcript=session["transcript"],
+            forbidden_words=session["forbidden_words"],
+            structure_prompt=session["structure_prompt"],
+            use_cache=use_cache
+        )
+        return await self.edit_paragraph(session_id, index, result["content"])
+
+    async def edit_paragraph(self, session_id: str, index: int, text: str) -> Optional[dict]:
+        session = await self.store.replace(session_id, index, text)
+        if session is None:
+            return None
+        return {"session": session, "paragraphs": await self.store.paragraphs(session_id, index, index + 1)}
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStateBackend:
+    """Rate-limit state kept inside this process; the default for a single worker.
+
+    State backends hold the token buckets of the model dispatcher. Backends
+    with ``shared = True`` are visible to every worker process on the host and
+    also provide the shared tier of the response cache (``cache_get`` /
+    ``cache_set``).
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._buckets = {}
+
+    async def take_tokens(self, name: str, amount: float, capacity: float, rate: float) -> float:
+        """Take ``amount`` units from a bucket; returns 0 on success, else the seconds to wait before retrying."""
+        tokens, updated = self._buckets.get(name, (capacity, time.monotonic()))
+        now = time.monotonic()
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= amount:
+            self._buckets[name] = (tokens - amount, now)
+            return 0.0
+        self._buckets[name] = (tokens, now)
+        return (amount - tokens) / rate
+
+    async def refund_tokens(self, name: str, amount: float, capacity: float, rate: float):
+        tokens, updated = self._buckets.get(name, (capacity, time.monotonic()))
+        now = time.monotonic()
+        self._buckets[name] = (min(capacity, tokens + (now - updated) * rate + amount), now)
+
+    def close(self):
+        pass
+
+
+class SQLiteStateBackend:
+    """Rate-limit buckets and cached responses in a SQLite file shared by all workers on the host.
+
+    Uses WAL journaling so readers do not block the writer, and takes the
+    write lock up front for bucket updates so concurrent workers never both
+    spend the same tokens.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str, max_cache_entries: int = 10000):
+        self.max_cache_entries = max_cache_entries
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    async def take_tokens(self, name: str, amount: float, capacity: float, rate: float) -> float:
+        return await asyncio.to_thread(self._update_bucket, name, -amount, capacity, rate)
+
+    async def refund_tokens(self, name: str, amount: float, capacity: float, rate: float):
+        await asyncio.to_thread(self._update_bucket, name, amount, capacity, rate)
+
+    async def cache_get(self, key: str, ttl_seconds: float) -> Optional[str]:
+        return await asyncio.to_thread(self._cache_get, key, time.time(), ttl_seconds)
+
+    async def cache_set(self, key: str, value: str, ttl_seconds: float):
+        await asyncio.to_thread(self._cache_set, key, value, time.time(), ttl_seconds)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _update_bucket(self, name: str, delta: float, capacity: float, rate: float) -> float:
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                wait = 0.0
+                if delta >= 0:
+                    tokens = min(capacity, tokens + delta)
+                elif tokens >= -delta:
+                    tokens += delta
+                else:
+                    wait = (-delta - tokens) / rate
+                self._db.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (name, tokens, now)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _cache_get(self, key: str, now: float, ttl_seconds: float) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            expired = row[1] + ttl_seconds <= now
+            try:
+                if expired:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                else:
+                    self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                # Another worker holds the write lock; the LRU bookkeeping can wait
+                logger.debug(f"Skipped response cache bookkeeping: {e}")
+            return None if expired else row[0]
+
+    def _cache_set(self, key: str, value: str, now: float, ttl_seconds: float):
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._db.execute("DELETE FROM responses WHERE created_at <= ?", (now - ttl_seconds,))
+                # Size-based eviction: drop least recently used rows beyond the cap
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_cache_entries,)
+                )
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                logger.warning(f"Failed to write response cache entry: {e}")
+
+
+def create_state_backend(kind: str, db_path: str = "", max_cache_entries: int = 10000):
+    """Build the backend named by SHARED_STATE_BACKEND ("memory" or "sqlite")."""
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(db_path, max_cache_entries=max_cache_entries)
+    raise ValueError(f"Unknown SHARED_STATE_BACKEND {kind!r}; expected 'memory' or 'sqlite'")
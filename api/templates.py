@@ -0,0 +1,198 @@
+"""Prompt templates and CTA schedules, compiled once per process.
+
+The built-in set lives in api/prompts.py. A deployment can override any
+template or CTA list from a JSON file (PROMPT_TEMPLATES_PATH):
+
+    {
+      "version": "2024-07",
+      "templates": {"part": "...", "system": "..."},
+      "ctas": {"intro": [...], "schedule": [{"from_words": 2000, "variants": [...]}], "end": [...]},
+      "channels": {"kids": {"templates": {...}, "ctas": {...}}}
+    }
+
+Entries under "channels" are applied on top for the channel named by
+PROMPT_CHANNEL. The registry version combines the configured label with a
+hash of the resulting templates, so cache keys change exactly when the
+prompts do.
+"""
+import bisect
+import hashlib
+import json
+import random
+import string
+from functools import lru_cache
+
+from .prompts import DEFAULT_CTAS, DEFAULT_TEMPLATES, format_forbidden_words
+
+# Fields each template may use; anything else is rejected when the templates are loaded
+TEMPLATE_FIELDS = {
+    "system": set(),
+    "default_structure": set(),
+    "script_prefix": {"title", "forbidden_words", "transcript_line", "structure_line"},
+    "transcript_line": {"transcript"},
+    "structure_line": {"structure_prompt"},
+    "part": {"part_word_count", "context", "cta_line"},
+    "part_cta_line": {"cta"},
+    "continuation": {"part_word_count", "context"},
+    "outline": {"word_count", "num_sections", "structure_section"},
+    "outline_structure_from_context": set(),
+    "outline_default_structure": {"default_structure"},
+    "outline_section": {"part_word_count", "outline_text", "section_number", "section_summary", "opening_line", "closing_line", "cta_line"},
+    "section_opening_first": set(),
+    "section_opening_next": {"previous_section"},
+    "section_closing_last": set(),
+    "section_closing_next": {"next_section"},
+    "section_cta_line": {"cta"},
+    "transition": {"previous_paragraph", "next_paragraph"},
+    "regenerate": {"context_before", "context_after", "segment_word_count"},
+    "repair": {"paragraph", "violations"},
+}
+
+
+class CompiledTemplate:
+    """A str.format template checked once at load; templates without fields are rendered once."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.fields = set()
+        for _, field, format_spec, conversion in string.Formatter().parse(text):
+            if field is None:
+                continue
+            if not field.isidentifier() or format_spec or conversion:
+                raise ValueError(f"Template {name!r}: unsupported field {{{field}}}, use plain {{name}} fields")
+            self.fields.add(field)
+        unknown = self.fields - TEMPLATE_FIELDS[name]
+        if unknown:
+            raise ValueError(f"Template {name!r} uses unknown fields: {', '.join(sorted(unknown))}")
+        self._static = None if self.fields else text.format()
+
+    def render(self, **values) -> str:
+        if self._static is not None:
+            return self._static
+        return self.text.format_map(values)
+
+
+class CtaSchedule:
+    """Which call to action goes into which part, with the thresholds sorted once."""
+
+    def __init__(self, intro: list, schedule: list, end: list):
+        self.intro = tuple(intro)
+        entries = sorted(schedule, key=lambda entry: entry["from_words"])
+        self._thresholds = [entry["from_words"] for entry in entries]
+        self._variants = [tuple(entry["variants"]) for entry in entries]
+        self.end = tuple(end)
+
+    @staticmethod
+    def pick(variants: tuple, seed: str = None) -> str:
+        if not variants:
+            return ""
+        # A seed keeps the choice stable for identical requests so their prompts stay cacheable
+        if seed is not None:
+            return random.Random(seed).choice(variants)
+        return random.choice(variants)
+
+    def for_part(self, index: int, start_words: int, seed: str = None) -> str:
+        part_seed = f"{seed}:{index}" if seed is not None else None
+        if index == 0:
+            return self.pick(self.intro, part_seed)
+        position = bisect.bisect_right(self._thresholds, start_words)
+        return self.pick(self._variants[position - 1], part_seed) if position else ""
+
+    def closing(self, seed: str = None) -> str:
+        return self.pick(self.end, seed)
+
+
+class TemplateRegistry:
+    """Renders every prompt the service sends, from templates compiled at startup."""
+
+    def __init__(self, templates: dict = None, ctas: dict = None, label: str = "builtin"):
+        texts = {**DEFAULT_TEMPLATES, **(templates or {})}
+        unknown = set(texts) - set(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown prompt templates: {', '.join(sorted(unknown))}")
+        cta_lists = {**DEFAULT_CTAS, **(ctas or {})}
+        self._templates = {name: CompiledTemplate(name, text) for name, text in texts.items()}
+        self.ctas = CtaSchedule(cta_lists["intro"], cta_lists["schedule"], cta_lists["end"])
+        digest = hashlib.sha256(json.dumps([texts, cta_lists], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        self.version = f"{label}:{digest[:12]}"
+        self.system = self._templates["system"].render()
+        self._outline_structure = {
+            True: self._templates["outline_structure_from_context"].render(),
+            False: self._templates["outline_default_structure"].render(default_structure=self._templates["default_structure"].render()),
+        }
+        # The prefix is rebuilt for every call about the same script; keep the recent ones
+        self._script_prefix = lru_cache(maxsize=256)(self._render_script_prefix)
+
+    def _render(self, name: str, **values) -> str:
+        return self._templates[name].render(**values)
+
+    def _optional(self, name: str, value, field: str) -> str:
+        return self._templates[name].render(**{field: value}) if value else ""
+
+    def script_prefix(self, title: str, transcript: str, structure_prompt: str, forbidden_words) -> str:
+        if isinstance(forbidden_words, list):
+            forbidden_words = tuple(forbidden_words)
+        return self._script_prefix(title, transcript, structure_prompt, forbidden_words)
+
+    def _render_script_prefix(self, title: str, transcript: str, structure_prompt: str, forbidden_words) -> str:
+        if isinstance(forbidden_words, tuple):
+            forbidden_words = list(forbidden_words)
+        return self._render(
+            "script_prefix",
+            title=title,
+            forbidden_words=format_forbidden_words(forbidden_words),
+            transcript_line=self._optional("transcript_line", transcript, "transcript"),
+            structure_line=self._optional("structure_line", structure_prompt, "structure_prompt")
+        )
+
+    def part(self, part_word_count: int, context: str, cta: str) -> str:
+        return self._render("part", part_word_count=part_word_count, context=context, cta_line=self._optional("part_cta_line", cta, "cta"))
+
+    def continuation(self, part_word_count: int, context: str) -> str:
+        return self._render("continuation", part_word_count=part_word_count, context=context)
+
+    def outline(self, structure_prompt: str, num_sections: int, word_count: int) -> str:
+        return self._render("outline", word_count=word_count, num_sections=num_sections, structure_section=self._outline_structure[bool(structure_prompt)])
+
+    def outline_section(self, part_word_count: int, outline: list[str], section: int, cta: str) -> str:
+        return self._render(
+            "outline_section",
+            part_word_count=part_word_count,
+            outline_text="\n".join(f"{i + 1}. {item}" for i, item in enumerate(outline)),
+            section_number=section + 1,
+            section_summary=outline[section],
+            opening_line=self._render("section_opening_first") if section == 0 else self._render("section_opening_next", previous_section=section),
+            closing_line=self._render("section_closing_last") if section == len(outline) - 1 else self._render("section_closing_next", next_section=section + 2),
+            cta_line=self._optional("section_cta_line", cta, "cta")
+        )
+
+    def transition(self, previous_paragraph: str, next_paragraph: str) -> str:
+        return self._render("transition", previous_paragraph=previous_paragraph, next_paragraph=next_paragraph)
+
+    def regenerate(self, context_before: str, context_after: str, segment_word_count: int) -> str:
+        return self._render("regenerate", context_before=context_before, context_after=context_after, segment_word_count=segment_word_count)
+
+    def repair(self, paragraph: str, violations: list[str]) -> str:
+        return self._render("repair", paragraph=paragraph, violations=", ".join(violations))
+
+
+def load_templates(path: str = None, channel: str = None) -> TemplateRegistry:
+    """Build the registry from the built-in templates and, if given, the deployment's overrides file."""
+    if not path:
+        if channel:
+            raise ValueError("PROMPT_CHANNEL is set but PROMPT_TEMPLATES_PATH is not")
+        return TemplateRegistry()
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    templates = dict(config.get("templates", {}))
+    ctas = dict(config.get("ctas", {}))
+    label = str(config.get("version", "custom"))
+    if channel:
+        overrides = config.get("channels", {}).get(channel)
+        if overrides is None:
+            raise ValueError(f"Channel {channel!r} is not defined in {path}")
+        templates.update(overrides.get("templates", {}))
+        ctas.update(overrides.get("ctas", {}))
+        label = f"{channel}@{overrides.get('version', label)}"
+    return TemplateRegistry(templates, ctas, label)
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Token usage accumulated for the request currently being served. Tasks spawned
+# with asyncio.gather copy the context, so they add to the same dict.
+_current_usage = ContextVar("request_usage", default=None)
+
+USAGE_FIELDS = (
+    "input_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+    "output_tokens",
+)
+
+
+def new_usage() -> dict:
+    usage = {field: 0 for field in USAGE_FIELDS}
+    usage["model_calls"] = 0
+    usage["cached_responses"] = 0
+    return usage
+
+
+@contextmanager
+def track_usage():
+    """Collect token usage of every model call made inside the block.
+
+    Blocks can be nested; on exit the inner totals are added to the enclosing block.
+    """
+    parent = _current_usage.get()
+    usage = new_usage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current_usage.reset(token)
+        except ValueError:
+            # An abandoned async generator is finalized from another context
+            pass
+        if parent is not None:
+            for field, value in usage.items():
+                parent[field] += value
+
+
+def usage_from_response(response_usage) -> dict:
+    """Read the token counters from an API ``usage`` object, defaulting missing ones to 0."""
+    return {field: getattr(response_usage, field, None) or 0 for field in USAGE_FIELDS}
+
+
+def record_usage(call_usage: dict):
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    for field in USAGE_FIELDS:
+        usage[field] += call_usage.get(field, 0)
+    usage["model_calls"] += 1
+
+
+def record_cached_response():
+    usage = _current_usage.get()
+    if usage is not None:
+        usage["cached_responses"] += 1
@@ -0,0 +1,181 @@
+"""Local stand-in for the Anthropic Messages API, for benchmarks and load tests.
+
+Run it with:
+
+    uvicorn bench.mock_anthropic:app --port 8100
+
+and start the API with ANTHROPIC_BASE_URL=http://127.0.0.1:8100. Behaviour is
+set with MOCK_* environment variables or at runtime via POST /mock/config:
+
+    latency_ms          time to first token
+    latency_jitter_ms   uniform jitter added to latency_ms
+    tokens_per_second   output speed (0 returns everything at once)
+    error_rate          fraction of calls answered with 529 overloaded_error
+    rate_limit_rate     fraction of calls answered with 429 rate_limit_error
+    retry_after         retry-after header sent with 429s, in seconds
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import uuid
+
+import fastapi
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the night was quiet until the stranger arrived in town carrying a worn leather bag "
+    "and a story nobody had heard before as rain fell on the old tin roofs of main street"
+).split()
+# Roughly 4 tokens per 3 English words
+TOKENS_PER_WORD = 4 / 3
+
+settings = {
+    "latency_ms": float(os.getenv("MOCK_LATENCY_MS", "300")),
+    "latency_jitter_ms": float(os.getenv("MOCK_LATENCY_JITTER_MS", "100")),
+    "tokens_per_second": float(os.getenv("MOCK_TOKENS_PER_SECOND", "400")),
+    "error_rate": float(os.getenv("MOCK_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("MOCK_RATE_LIMIT_RATE", "0")),
+    "retry_after": float(os.getenv("MOCK_RETRY_AFTER", "1")),
+}
+stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0}
+
+app = fastapi.FastAPI()
+
+
+def _prompt_text(body: dict) -> str:
+    content = body["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content)
+
+
+def _input_tokens(body: dict) -> int:
+    system = body.get("system") or ""
+    if not isinstance(system, str):
+        system = "".join(block.get("text", "") for block in system)
+    return int(len((system + _prompt_text(body)).split()) * TOKENS_PER_WORD)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, words: int) -> list[str]:
+    paragraphs = []
+    while words > 0:
+        size = min(words, rng.randint(60, 120))
+        paragraphs.append(_sentence(rng, size))
+        words -= size
+    return paragraphs
+
+
+def build_completion(body: dict) -> str:
+    """Produce output shaped like what the service's prompts ask for."""
+    prompt = _prompt_text(body)
+    rng = random.Random(prompt)
+    max_words = int(body["max_tokens"] / TOKENS_PER_WORD)
+
+    sections = re.search(r"Number of Sections: (\d+)", prompt)
+    if sections:
+        return json.dumps([_sentence(rng, 40) for _ in range(int(sections.group(1)))])
+
+    target = re.search(r"Target Word Count for this (?:part|section): (\d+)", prompt) or re.search(r"approximately (\d+) words", prompt)
+    words = min(int(target.group(1)) if target else 150, max_words)
+    if '"content"' in prompt:
+        content = " ".join(_paragraphs(rng, words))
+        result = {"content": content}
+        if "wordCount" in prompt:
+            result["wordCount"] = len(content.split())
+        return json.dumps(result)
+    return json.dumps(_paragraphs(rng, words))
+
+
+def _injected_error():
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"type": "error", "error": {"type": "rate_limit_error", "message": "Mock rate limit"}},
+            status_code=429,
+            headers={"retry-after": str(settings["retry_after"])}
+        )
+    if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(
+            {"type": "error", "error": {"type": "overloaded_error", "message": "Mock overload"}},
+            status_code=529
+        )
+    return None
+
+
+async def _wait_first_token():
+    latency = settings["latency_ms"] + random.uniform(0, settings["latency_jitter_ms"])
+    await asyncio.sleep(latency / 1000)
+
+
+def _message(body: dict, text: str, output_tokens: int) -> dict:
+    return {
+        "id": f"msg_mock_{uuid.uuid4().hex[:16]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": [{"type": "text", "text": text}] if text is not None else [],
+        "stop_reason": "end_turn" if text is not None else None,
+        "stop_sequence": None,
+        "usage": {"input_tokens": _input_tokens(body), "output_tokens": output_tokens}
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream(body: dict, text: str):
+    output_tokens = int(len(text.split()) * TOKENS_PER_WORD)
+    yield _sse("message_start", {"type": "message_start", "message": _message(body, None, 1)})
+    yield _sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+    tps = settings["tokens_per_second"]
+    # Emit roughly five tokens per delta, like the real API
+    chunk_chars = 20
+    for start in range(0, len(text), chunk_chars):
+        if tps > 0:
+            await asyncio.sleep(5 / tps)
+        delta = {"type": "text_delta", "text": text[start:start + chunk_chars]}
+        yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta})
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": output_tokens}})
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def messages(request: fastapi.Request):
+    body = await request.json()
+    stats["requests"] += 1
+    error = _injected_error()
+    if error is not None:
+        return error
+    text = build_completion(body)
+    await _wait_first_token()
+    if body.get("stream"):
+        stats["streams"] += 1
+        return StreamingResponse(_stream(body, text), media_type="text/event-stream")
+    output_tokens = int(len(text.split()) * TOKENS_PER_WORD)
+    if settings["tokens_per_second"] > 0:
+        await asyncio.sleep(output_tokens / settings["tokens_per_second"])
+    return _message(body, text, output_tokens)
+
+
+@app.get("/mock/config")
+async def get_config():
+    return {"settings": settings, "stats": stats}
+
+
+@app.post("/mock/config")
+async def update_config(update: dict):
+    unknown = set(update) - set(settings)
+    if unknown:
+        raise fastapi.HTTPException(status_code=400, detail=f"Unknown settings: {', '.join(sorted(unknown))}")
+    settings.update({key: float(value) for key, value in update.items()})
+    return {"settings": settings}
@@ -0,0 +1,280 @@
+"""Benchmark the API against the local mock Messages API.
+
+Starts bench/mock_anthropic.py in a subprocess, serves api.main:app with
+uvicorn inside this process (so event-loop stalls in the app are measurable)
+and drives /generate-script, /generate-script/stream and /regenerate-segment
+at a fixed concurrency. Results are written as JSON so runs can be compared:
+
+    python -m bench.run_benchmark --concurrency 8 --requests 32 --word-counts 1000,5000
+    python -m bench.run_benchmark --compare bench/results/baseline.json
+
+Run it from the repository root.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+# Interval of the event-loop lag probe; any extra delay is time the loop was blocked
+LAG_PROBE_INTERVAL = 0.01
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": statistics.fmean(values),
+        "max": max(values),
+    }
+
+
+class LoopLagMonitor:
+    """Samples how late a periodic sleep wakes up on the app's event loop."""
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.samples.append(max(0.0, time.perf_counter() - started - LAG_PROBE_INTERVAL))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def build_scenarios(word_counts: list, segment_words: int) -> list:
+    scenarios = []
+    for word_count in word_counts:
+        body = {"word_count": word_count, "forbidden_words": ["suddenly"], "inspirational_transcript": "A quiet town, a stranger, a secret. " * 50}
+        scenarios.append({"name": f"generate-script:{word_count}", "path": "/generate-script", "body": body})
+        scenarios.append({"name": f"generate-script-stream:{word_count}", "path": "/generate-script/stream", "body": body})
+    scenarios.append({
+        "name": f"regenerate-segment:{segment_words}",
+        "path": "/regenerate-segment",
+        "body": {"context_before": "The stranger opened the bag.", "context_after": "Nobody spoke.", "segment_word_count": segment_words}
+    })
+    return scenarios
+
+
+async def timed_request(client: httpx.AsyncClient, path: str, body: dict) -> dict:
+    started = time.perf_counter()
+    ttfb = None
+    size = 0
+    async with client.stream("POST", path, json=body) as response:
+        async for chunk in response.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            size += len(chunk)
+    return {"status": response.status_code, "latency": time.perf_counter() - started, "ttfb": ttfb, "bytes": size}
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: dict, requests: int, concurrency: int, monitor: LoopLagMonitor) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        # Unique titles keep identical prompts from being coalesced into one upstream call
+        body = {**scenario["body"], "title": f"Benchmark {scenario['name']} #{index}", "bypass_cache": True}
+        async with semaphore:
+            try:
+                return await timed_request(client, scenario["path"], body)
+            except httpx.HTTPError as e:
+                return {"status": None, "error": str(e)}
+
+    first_sample = len(monitor.samples)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    lags = monitor.samples[first_sample:]
+
+    ok = [result for result in results if result.get("status") == 200]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": requests - len(ok),
+        "status_codes": {str(code): sum(1 for r in results if r.get("status") == code) for code in {r.get("status") for r in results}},
+        "elapsed_s": elapsed,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize([r["latency"] * 1000 for r in ok]),
+        "ttfb_ms": summarize([r["ttfb"] * 1000 for r in ok if r["ttfb"] is not None]),
+        "response_bytes": summarize([r["bytes"] for r in ok]),
+        "event_loop": {
+            "blocked_ms": sum(lags) * 1000,
+            "max_lag_ms": max(lags) * 1000 if lags else 0.0,
+            "p99_lag_ms": (percentile(lags, 99) or 0.0) * 1000,
+        },
+    }
+
+
+async def wait_until_up(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.2)
+
+
+def start_mock(port: int, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MOCK_LATENCY_MS": str(args.mock_latency_ms),
+        "MOCK_TOKENS_PER_SECOND": str(args.mock_tokens_per_second),
+        "MOCK_ERROR_RATE": str(args.mock_error_rate),
+        "MOCK_RATE_LIMIT_RATE": str(args.mock_rate_limit_rate),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.mock_anthropic:app", "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def benchmark(args) -> dict:
+    mock = None
+    mock_url = args.mock_url
+    if mock_url is None:
+        mock = start_mock(args.mock_port, args)
+        mock_url = f"http://127.0.0.1:{args.mock_port}"
+    try:
+        await wait_until_up(f"{mock_url}/mock/config")
+
+        # The app reads its settings at import time, so configure it before importing
+        os.environ["ANTHROPIC_BASE_URL"] = mock_url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+        os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+        os.environ.setdefault("MODEL_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.db"))
+        import uvicorn
+        from api.main import app
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        monitor = LoopLagMonitor()
+        monitor.start()
+        results = {}
+        timeout = httpx.Timeout(args.timeout)
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=timeout, limits=limits) as client:
+            for scenario in build_scenarios(args.word_counts, args.segment_words):
+                if args.scenarios and not any(scenario["name"].startswith(name) for name in args.scenarios):
+                    continue
+                print(f"Running {scenario['name']} ({args.requests} requests, concurrency {args.concurrency})", file=sys.stderr)
+                results[scenario["name"]] = await run_scenario(client, scenario, args.requests, args.concurrency, monitor)
+        await monitor.stop()
+        server.should_exit = True
+        await server_task
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("compare", "output")},
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: dict, baseline: dict):
+    """Print the change of the headline numbers against a baseline run."""
+    rows = [("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"), ("ttfb_ms", "p50"), ("event_loop", "blocked_ms")]
+    print(f"{'scenario':36} {'metric':22} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for group, key in rows:
+            old, new = base.get(group, {}).get(key), result.get(group, {}).get(key)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{name:36} {group + '.' + key:22} {old:12.1f} {new:12.1f} {change:>9}")
+        change = f"{(result['rps'] - base['rps']) / base['rps'] * 100:+.1f}%" if base["rps"] else "n/a"
+        print(f"{name:36} {'rps':22} {base['rps']:12.2f} {result['rps']:12.2f} {change:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=16, help="requests per scenario")
+    parser.add_argument("--word-counts", type=lambda value: [int(v) for v in value.split(",")], default=[1000, 5000])
+    parser.add_argument("--segment-words", type=int, default=150)
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=None, help="comma-separated scenario name prefixes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--mock-url", default=None, help="use an already running mock instead of starting one")
+    parser.add_argument("--mock-port", type=int, default=8766)
+    parser.add_argument("--mock-latency-ms", type=float, default=300)
+    parser.add_argument("--mock-tokens-per-second", type=float, default=400)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=None, help="result file (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(benchmark(args))
+    output = args.output or os.path.join("bench", "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {output}", file=sys.stderr)
+    for name, scenario in result["scenarios"].items():
+        print(f"{name:36} ok={scenario['ok']}/{scenario['requests']} rps={scenario['rps']:.2f} "
+              f"p50={scenario['latency_ms'].get('p50', 0):.0f}ms p99={scenario['latency_ms'].get('p99', 0):.0f}ms "
+              f"ttfb_p50={scenario['ttfb_ms'].get('p50', 0):.0f}ms loop_blocked={scenario['event_loop']['blocked_ms']:.0f}ms")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
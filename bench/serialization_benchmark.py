@@ -0,0 +1,128 @@
+"""Benchmark how script responses are serialized and how many bytes they put on the wire.
+
+Builds /generate-script responses of the given sizes and measures, in this
+process and without a server:
+
+- render time of the stdlib JSON path FastAPI used before ("json") and of the
+  orjson path the app now uses ("orjson"), both including response model
+  validation;
+- body size uncompressed and with gzip and brotli at the configured levels,
+  plus the time spent compressing.
+
+    python -m bench.serialization_benchmark --word-counts 10000,20000,30000
+    python -m bench.serialization_benchmark --output bench/results/serialization.json
+
+Run it from the repository root.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+import brotli  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from api.config import COMPRESSION_BROTLI_QUALITY, COMPRESSION_GZIP_LEVEL  # noqa: E402
+from api.models import ScriptResponse  # noqa: E402
+
+# Word frequencies loosely follow English prose so compression ratios are realistic
+VOCABULARY = (
+    "the of and to a in that was he she it his her with as for had on at by not but "
+    "from they were have one all we when there been an which their said would if into "
+    "could time more no out up so what about then them only other two like night door "
+    "house old man woman eyes hand looked back away never before something through town "
+    "road light voice father mother years knew felt thought told secret stranger quiet "
+    "morning letter window silence remembered whispered darkness suddenly everything"
+).split()
+
+
+def build_response(word_count: int, words_per_paragraph: int = 90, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+    paragraphs = []
+    remaining = word_count
+    while remaining > 0:
+        words = rng.choices(VOCABULARY, weights, k=min(words_per_paragraph, remaining))
+        paragraphs.append(" ".join(words).capitalize() + ". “Quoted,” she said — café.")
+        remaining -= len(words)
+    return {
+        "paragraphs": paragraphs,
+        "total_words": word_count,
+        "usage": {"input_tokens": 5210, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 4100, "output_tokens": 41800, "model_calls": 9, "cached_responses": 0},
+        "partial": False,
+        "stop_reason": "completed",
+    }
+
+
+def timed(function, repeat: int) -> tuple:
+    """Median milliseconds of ``repeat`` calls, and the last result."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+async def measure(word_count: int, repeat: int) -> dict:
+    field = create_response_field(name="response", type_=ScriptResponse, mode="serialization")
+    content = build_response(word_count)
+
+    async def render(response_class) -> tuple:
+        samples = []
+        body = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            value = await serialize_response(field=field, response_content=content)
+            body = response_class(value).body
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples), body
+
+    json_ms, json_body = await render(JSONResponse)
+    orjson_ms, orjson_body = await render(ORJSONResponse)
+    gzip_ms, gzip_body = timed(lambda: gzip.compress(orjson_body, COMPRESSION_GZIP_LEVEL), repeat)
+    brotli_ms, brotli_body = timed(lambda: brotli.compress(orjson_body, quality=COMPRESSION_BROTLI_QUALITY), repeat)
+    return {
+        "paragraphs": len(content["paragraphs"]),
+        "serialize_ms": {"json": round(json_ms, 3), "orjson": round(orjson_ms, 3)},
+        "bytes": {"json": len(json_body), "orjson": len(orjson_body), "gzip": len(gzip_body), "br": len(brotli_body)},
+        "compress_ms": {"gzip": round(gzip_ms, 3), "br": round(brotli_ms, 3)},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--word-counts", type=lambda value: [int(v) for v in value.split(",")], default=[10000, 20000, 30000])
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per measurement (the median is reported)")
+    parser.add_argument("--output", default=None, help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {str(word_count): asyncio.run(measure(word_count, args.repeat)) for word_count in args.word_counts}
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"gzip_level": COMPRESSION_GZIP_LEVEL, "brotli_quality": COMPRESSION_BROTLI_QUALITY, "results": results}, f, indent=2)
+        print(f"Saved results to {args.output}", file=sys.stderr)
+    print(f"{'words':>7} {'json ms':>8} {'orjson ms':>9} {'bytes':>9} {'gzip':>8} {'gzip ms':>8} {'br':>8} {'br ms':>7}")
+    for word_count, result in results.items():
+        print(
+            f"{word_count:>7} {result['serialize_ms']['json']:8.2f} {result['serialize_ms']['orjson']:9.2f} "
+            f"{result['bytes']['orjson']:9d} {result['bytes']['gzip']:8d} {result['compress_ms']['gzip']:8.2f} "
+            f"{result['bytes']['br']:8d} {result['compress_ms']['br']:7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()